@@ -1,18 +1,47 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import (
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeout,
+)
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 from io import BytesIO
+from itertools import islice
 from typing import Optional
+import gzip
+import hashlib
+import json
+import mimetypes
 import os
+import re
+import tempfile
+import threading
+import time
 
+import click
+try:
+    import brotli  # optional: adds a "br" variant to cached JSON responses
+except ImportError:
+    brotli = None
 from flask import (
     Flask,
+    Response,
+    abort,
+    g,
+    has_request_context,
     jsonify,
     send_from_directory,
-    send_file,
+    stream_with_context,
     request,
-    render_template_string,
     url_for,
 )
 from flask_cors import CORS
-from PIL import Image, ImageDraw, ImageFont
+from werkzeug.security import safe_join
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
 CORS(app)
@@ -20,111 +49,767 @@ CORS(app)
 # =========================
 # Config / cache-busting
 # =========================
-APP_ASSET_VERSION = "v5"         # меняй при каждом редизайне
+APP_ASSET_VERSION = "v5"         # ручной сброс всего; URL сами берут хэши ассетов (share_version)
 DEFAULT_STYLE = "neo"            # "neo" (фон из файла), "classic", "violet"
+BG_PATH = os.path.join(app.root_path, "static", "share_bg", "neo_bg.png")
 
-def bust(url: str) -> str:
+def bust(url: str, style: str = DEFAULT_STYLE) -> str:
+    """Append the fingerprint of what a share image of `style` is drawn from."""
     sep = "&" if "?" in url else "?"
-    return f"{url}{sep}v={APP_ASSET_VERSION}"
+    return f"{url}{sep}v={share_version(style)}"
+
+# =========================
+# Instrumentation
+# =========================
+# Off unless METRICS=1: span() then returns a shared no-op context and the
+# metric helpers return immediately. When on, each request collects named
+# phase timings (sent back as Server-Timing), and every worker periodically
+# snapshots its counters into METRICS_DIR; /metrics sums all snapshots so the
+# numbers cover every gunicorn worker. With --preload the default directory
+# is shared by the workers automatically; otherwise set METRICS_DIR.
+METRICS_ENABLED = os.environ.get("METRICS", "") not in ("", "0")
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(
+    tempfile.gettempdir(), f"share-metrics-{os.getpid()}")
+METRICS_FLUSH_INTERVAL = 1.0
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_SPAN = nullcontext()
+_COUNTERS: dict = {}    # (name, labels) -> float
+_HISTOGRAMS: dict = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_METRICS_LOCK = threading.Lock()
+_metrics_flushed = 0.0
+_metrics_timer = None
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        spans = g.setdefault("spans", {})
+        spans[self.name] = spans.get(self.name, 0.0) + time.perf_counter() - self.t0
+
+def span(name: str):
+    """Time a hot-path phase of the current request (no-op when metrics are off)."""
+    if not METRICS_ENABLED or not has_request_context():
+        return _NULL_SPAN
+    return _Span(name)
+
+def metric_inc(name: str, value: float = 1.0, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0.0) + value
+
+def metric_observe(name: str, seconds: float, **labels):
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _METRICS_LOCK:
+        h = _HISTOGRAMS.get(key)
+        if h is None:
+            h = _HISTOGRAMS[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        h[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        h[-1] += seconds
+
+def _metrics_flush(force: bool = False):
+    """
+    Write this worker's snapshot to METRICS_DIR/<pid>.json. Throttled; a
+    skipped flush is retried by a timer so an idle worker is never left stale.
+    """
+    global _metrics_flushed, _metrics_timer
+    now = time.monotonic()
+    if not force and now - _metrics_flushed < METRICS_FLUSH_INTERVAL:
+        if _metrics_timer is None:
+            _metrics_timer = threading.Timer(METRICS_FLUSH_INTERVAL, _metrics_flush, kwargs={"force": True})
+            _metrics_timer.daemon = True
+            _metrics_timer.start()
+        return
+    _metrics_flushed = now
+    _metrics_timer = None
+    with _METRICS_LOCK:
+        snap = {
+            "counters": [[n, list(l), v] for (n, l), v in _COUNTERS.items()],
+            "histograms": [[n, list(l), h] for (n, l), h in _HISTOGRAMS.items()],
+        }
+    try:
+        _write_atomic(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), json.dumps(snap).encode("utf-8"))
+    except OSError:
+        pass
+
+def _metrics_forked():
+    """A forked worker starts from zero; the parent's counts are in the parent's snapshot."""
+    global _METRICS_LOCK, _metrics_flushed, _metrics_timer
+    _COUNTERS.clear()
+    _HISTOGRAMS.clear()
+    _METRICS_LOCK = threading.Lock()
+    _metrics_flushed, _metrics_timer = 0.0, None
+
+def _metrics_before_fork():
+    # e.g. the PRERENDER_ON_START warm in the --preload master: counted once, here
+    if METRICS_ENABLED and (_COUNTERS or _HISTOGRAMS):
+        _metrics_flush(force=True)
+
+os.register_at_fork(before=_metrics_before_fork, after_in_child=_metrics_forked)
+
+def _metrics_collect():
+    """Sum the snapshots of every worker (including exited ones: counters stay monotonic)."""
+    counters, hists = {}, {}
+    try:
+        names = [f for f in os.listdir(METRICS_DIR) if f.endswith(".json")]
+    except OSError:
+        names = []
+    for fname in names:
+        try:
+            with open(os.path.join(METRICS_DIR, fname)) as fh:
+                snap = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        for n, l, v in snap["counters"]:
+            key = (n, tuple(map(tuple, l)))
+            counters[key] = counters.get(key, 0.0) + v
+        for n, l, h in snap["histograms"]:
+            key = (n, tuple(map(tuple, l)))
+            acc = hists.setdefault(key, [0] * len(h))
+            for i, v in enumerate(h):
+                acc[i] += v
+    return counters, hists
+
+def _prom_value(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
 
-def nocache_png_response(buf: BytesIO):
-    resp = send_file(buf, mimetype="image/png")
-    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    resp.headers["Pragma"] = "no-cache"
+def _prom_labels(labels, extra=()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_prom_value(v)}"' for k, v in items) + "}"
+
+def metrics_text() -> str:
+    counters, hists = _metrics_collect()
+    lines, seen = [], set()
+    for (name, labels), v in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_prom_labels(labels)} {v:g}")
+    for (name, labels), h in sorted(hists.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cum = 0
+        for le, c in zip(LATENCY_BUCKETS, h):
+            cum += c
+            lines.append(f"{name}_bucket{_prom_labels(labels, [('le', le)])} {cum}")
+        cum += h[len(LATENCY_BUCKETS)]
+        lines.append(f"{name}_bucket{_prom_labels(labels, [('le', '+Inf')])} {cum}")
+        lines.append(f"{name}_sum{_prom_labels(labels)} {h[-1]:.6f}")
+        lines.append(f"{name}_count{_prom_labels(labels)} {cum}")
+    return "\n".join(lines) + "\n"
+
+@app.before_request
+def _metrics_start():
+    if METRICS_ENABLED:
+        g.t0 = time.perf_counter()
+
+@app.after_request
+def _metrics_finish(resp):
+    if not METRICS_ENABLED or "t0" not in g:
+        return resp
+    total = time.perf_counter() - g.t0
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    style = _norm_style(request.args.get("style")) if "/image/" in route else ""  # bounded label set
+    metric_observe("http_request_duration_seconds", total, route=route, style=style)
+    metric_inc("http_responses_total", route=route, status=resp.status_code)
+    if not resp.is_streamed:
+        metric_inc("http_response_bytes_total", resp.content_length or 0, route=route)
+    spans = g.get("spans", {})
+    timing = [f"{k};dur={v * 1000:.2f}" for k, v in spans.items()]
+    timing.append(f"total;dur={total * 1000:.2f}")
+    resp.headers["Server-Timing"] = ", ".join(timing)
+    _metrics_flush()
     return resp
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition, aggregated over all workers."""
+    if not METRICS_ENABLED:
+        return "metrics disabled (set METRICS=1)\n", 404, {"Content-Type": "text/plain"}
+    _metrics_flush(force=True)
+    return metrics_text(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 # =========================
 # Data
 # =========================
-PAIRS = [
-    {"rank": 1, "symbol": "BTC", "name": "Bitcoin",  "score": 94, "apy": 245},
-    {"rank": 2, "symbol": "ETH", "name": "Ethereum", "score": 89, "apy": 189},
-    {"rank": 3, "symbol": "SOL", "name": "Solana",   "score": 87, "apy": 167},
-    {"rank": 4, "symbol": "XRP", "name": "Ripple",   "score": 85, "apy": 158},
-    {"rank": 5, "symbol": "DOGE","name": "Dogecoin", "score": 82, "apy": 143},
+class SymbolRecord:
+    """One symbol's live snapshot. `version` grows on every update (store-wide sequence)."""
+    __slots__ = ("symbol", "name", "score", "apy", "price", "change_pct", "volume_24h",
+                 "cap", "volatility", "trend_pct", "in_channel", "exchange", "version")
+
+    PAIR_FIELDS = ("symbol", "name", "score", "apy")
+    DETAIL_FIELDS = ("symbol", "name", "score", "price", "change_pct", "volume_24h", "cap",
+                     "volatility", "trend_pct", "in_channel", "exchange")
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.name = symbol
+        self.score = 0
+        self.apy = 0
+        self.price = 0.0
+        self.change_pct = 0.0
+        self.volume_24h = 0
+        self.cap = 0
+        self.volatility = 0.0
+        self.trend_pct = 0.0
+        self.in_channel = False
+        self.exchange = "Binance"
+        self.version = 0
+
+    def rank_key(self):
+        return (-self.score, -self.apy, self.symbol)
+
+    def pair(self, rank: int) -> dict:
+        d = {"rank": rank}
+        for f in self.PAIR_FIELDS:
+            d[f] = getattr(self, f)
+        return d
+
+    def details(self) -> dict:
+        return {f: getattr(self, f) for f in self.DETAIL_FIELDS}
+
+class MarketStore:
+    """
+    In-memory symbol store with an incrementally maintained ranking
+    (score desc, apy desc, symbol): updates move one key with bisect
+    instead of re-sorting the whole list.
+    """
+    def __init__(self):
+        self._recs: dict = {}
+        self._rank: list = []
+        self._lock = threading.RLock()
+        self._listeners: list = []
+        self.version = 0  # store-wide, bumps on every update
+
+    def add_listener(self, fn):
+        """fn(version, symbol, fields) is called under the store lock, in version order."""
+        self._listeners.append(fn)
+
+    def upsert(self, symbol: str, **fields) -> int:
+        sym = symbol.upper()
+        with self._lock:
+            rec = self._recs.get(sym)
+            if rec is None:
+                rec = self._recs[sym] = SymbolRecord(sym)
+                old_key = None
+            else:
+                old_key = rec.rank_key()
+            for k, v in fields.items():
+                if k in SymbolRecord.__slots__ and k not in ("symbol", "version"):
+                    setattr(rec, k, v)
+            new_key = rec.rank_key()
+            if old_key != new_key:
+                if old_key is not None:
+                    del self._rank[bisect_left(self._rank, old_key)]
+                insort(self._rank, new_key)
+            self.version += 1
+            rec.version = self.version
+            for fn in self._listeners:
+                fn(rec.version, sym, fields)
+            return rec.version
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self._recs
+
+    def __len__(self) -> int:
+        return len(self._recs)
+
+    def symbols(self):
+        with self._lock:
+            return [k[2] for k in self._rank]
+
+    def get(self, symbol: str) -> Optional[dict]:
+        return self.get_versioned(symbol)[0]
+
+    def get_versioned(self, symbol: str):
+        """(details, symbol version) read together; use the version as a cache key for the data."""
+        with self._lock:
+            rec = self._recs.get(symbol.upper())
+            return (rec.details(), rec.version) if rec is not None else (None, 0)
+
+    def symbol_version(self, symbol: str) -> int:
+        rec = self._recs.get(symbol.upper())
+        return rec.version if rec is not None else 0
+
+    def top(self, n: int = 5) -> list:
+        return self.page(n)[0]
+
+    def page(self, limit: int, cursor: Optional[str] = None):
+        """
+        Ranked slice after `cursor` (an opaque position from a previous page);
+        returns (items, next_cursor). Cursors stay valid while ranks shift.
+        """
+        return self.page_versioned(limit, cursor)[:2]
+
+    def page_versioned(self, limit: int, cursor: Optional[str] = None):
+        """page() plus the store version it was read at: (items, next_cursor, version)."""
+        with self._lock:
+            start = 0
+            if cursor:
+                score, apy, sym = cursor.split(":", 2)
+                start = bisect_right(self._rank, (-float(score), -float(apy), sym))
+            keys = self._rank[start:start + limit]
+            items = [self._recs[k[2]].pair(start + i + 1) for i, k in enumerate(keys)]
+            nxt = None
+            if start + limit < len(self._rank) and keys:
+                last = keys[-1]
+                nxt = f"{-last[0]}:{-last[1]}:{last[2]}"
+            return items, nxt, self.version
+
+class ReplayFeed:
+    """
+    Ingest source that replays JSON-lines updates from a file, one
+    {"symbol": "BTC", "price": ...} object per line. Any iterable of
+    update dicts works as a feed.
+    """
+    def __init__(self, path: str, interval: float = 0.0, loop: bool = False):
+        self.path, self.interval, self.loop = path, interval, loop
+
+    def __iter__(self):
+        while True:
+            with open(self.path, encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+                        if self.interval:
+                            time.sleep(self.interval)
+            if not self.loop:
+                return
+
+def ingest(feed, store: "MarketStore") -> int:
+    n = 0
+    for upd in feed:
+        upd = dict(upd)
+        store.upsert(upd.pop("symbol"), **upd)
+        n += 1
+    return n
+
+# =========================
+# Price history
+# =========================
+# Each symbol keeps its last HISTORY_SIZE price ticks in a ring of two
+# preallocated float arrays (16 bytes/sample), so memory per symbol is fixed
+# no matter how long the feed runs. Readers get min-max downsampled series:
+# per-bucket min/max run in C over array slices, Python only loops over buckets.
+HISTORY_SIZE = int(os.environ.get("HISTORY_SIZE", "2048"))
+SPARK_POINTS = 48  # points drawn on pair cards
+HISTORY_POINTS_DEFAULT, HISTORY_POINTS_MAX = 120, 1000
+
+class PriceRing:
+    """Fixed-capacity (t, price) ring."""
+    __slots__ = ("t", "p", "head", "n")
+
+    def __init__(self, size: int):
+        self.t = array("d", bytes(8 * size))
+        self.p = array("d", bytes(8 * size))
+        self.head = 0
+        self.n = 0
+
+    def append(self, t: float, price: float):
+        self.t[self.head] = t
+        self.p[self.head] = price
+        self.head = (self.head + 1) % len(self.p)
+        if self.n < len(self.p):
+            self.n += 1
+
+    def series(self):
+        """(t, p) arrays, oldest first."""
+        if self.n < len(self.p):
+            return self.t[:self.n], self.p[:self.n]
+        h = self.head
+        return self.t[h:] + self.t[:h], self.p[h:] + self.p[:h]
+
+def minmax_downsample(t, p, points: int):
+    """Keep each bucket's min and max in time order -> at most `points` samples."""
+    n = len(p)
+    if n <= points:
+        return list(t), list(p)
+    buckets = max(1, points // 2)
+    ts, ps = [], []
+    for i in range(buckets):
+        a, b = i * n // buckets, (i + 1) * n // buckets
+        seg = p[a:b]
+        lo, hi = seg.index(min(seg)), seg.index(max(seg))
+        for j in ((lo, hi) if lo < hi else (hi, lo) if hi < lo else (lo,)):
+            ts.append(t[a + j])
+            ps.append(seg[j])
+    return ts, ps
+
+class PriceHistory:
+    """Per-symbol PriceRing, fed by a MarketStore listener on price updates."""
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.size = size
+        self._rings: dict = {}
+        self._lock = threading.Lock()
+
+    def record(self, _version, symbol: str, fields: dict):
+        price = fields.get("price")
+        if price is None or self.size <= 0:
+            return
+        with self._lock:
+            ring = self._rings.get(symbol)
+            if ring is None:
+                ring = self._rings[symbol] = PriceRing(self.size)
+            ring.append(time.time(), float(price))
+
+    def series(self, symbol: str):
+        with self._lock:
+            ring = self._rings.get(symbol.upper())
+            return ring.series() if ring is not None else (array("d"), array("d"))
+
+    def downsample(self, symbol: str, points: int):
+        return minmax_downsample(*self.series(symbol), points)
+
+SEED = [
+    {"symbol": "BTC", "name": "Bitcoin", "score": 94, "apy": 245, "price": 43285.12,
+     "change_pct": 2.3, "volume_24h": 28943150, "cap": 847392847,
+     "volatility": 8.5, "trend_pct": 52.1, "in_channel": True, "exchange": "Binance"},
+    {"symbol": "ETH", "name": "Ethereum", "score": 89, "apy": 189, "price": 3125.40,
+     "change_pct": 1.7, "volume_24h": 14211320, "cap": 402392111,
+     "volatility": 9.2, "trend_pct": 48.0, "in_channel": True, "exchange": "Binance"},
+    {"symbol": "SOL", "name": "Solana", "score": 87, "apy": 167, "price": 112.75,
+     "change_pct": 3.1, "volume_24h": 8123411, "cap": 50011222,
+     "volatility": 11.0, "trend_pct": 55.4, "in_channel": True, "exchange": "Binance"},
+    {"symbol": "XRP", "name": "Ripple", "score": 85, "apy": 158, "price": 0.68,
+     "change_pct": -0.6, "volume_24h": 5123980, "cap": 35200111,
+     "volatility": 7.8, "trend_pct": 41.2, "in_channel": False, "exchange": "Binance"},
+    {"symbol": "DOGE", "name": "Dogecoin", "score": 82, "apy": 143, "price": 0.19,
+     "change_pct": 0.9, "volume_24h": 3894112, "cap": 26221111,
+     "volatility": 10.2, "trend_pct": 39.7, "in_channel": True, "exchange": "Binance"},
 ]
 
-DETAILS = {
-    "BTC": {
-        "symbol": "BTC", "name": "Bitcoin", "score": 94, "price": 43285.12,
-        "change_pct": 2.3, "volume_24h": 28943150, "cap": 847392847,
-        "volatility": 8.5, "trend_pct": 52.1, "in_channel": True, "exchange": "Binance"
-    },
-    "ETH": {
-        "symbol": "ETH", "name": "Ethereum", "score": 89, "price": 3125.40,
-        "change_pct": 1.7, "volume_24h": 14211320, "cap": 402392111,
-        "volatility": 9.2, "trend_pct": 48.0, "in_channel": True, "exchange": "Binance"
-    },
-    "SOL": {
-        "symbol": "SOL", "name": "Solana", "score": 87, "price": 112.75,
-        "change_pct": 3.1, "volume_24h": 8123411, "cap": 50011222,
-        "volatility": 11.0, "trend_pct": 55.4, "in_channel": True, "exchange": "Binance"
-    },
-    "XRP": {
-        "symbol": "XRP", "name": "Ripple", "score": 85, "price": 0.68,
-        "change_pct": -0.6, "volume_24h": 5123980, "cap": 35200111,
-        "volatility": 7.8, "trend_pct": 41.2, "in_channel": False, "exchange": "Binance"
-    },
-    "DOGE": {
-        "symbol": "DOGE", "name": "Dogecoin", "score": 82, "price": 0.19,
-        "change_pct": 0.9, "volume_24h": 3894112, "cap": 26221111,
-        "volatility": 10.2, "trend_pct": 39.7, "in_channel": True, "exchange": "Binance"
-    },
-}
+MARKET = MarketStore()
+HISTORY = PriceHistory()
+MARKET.add_listener(HISTORY.record)
+ingest(SEED, MARKET)
+
+def pair_card(symbol: str) -> Optional[dict]:
+    """Payload of the pair share images: details plus the sparkline prices."""
+    d = MARKET.get(symbol)
+    if d is not None:
+        d["spark"] = HISTORY.downsample(symbol, SPARK_POINTS)[1]
+    return d
+
+MARKET_FEED = os.environ.get("MARKET_FEED")  # path to a JSON-lines replay file
+MARKET_FEED_INTERVAL = float(os.environ.get("MARKET_FEED_INTERVAL", "0"))
+_FEED_PID = None
+_FEED_LOCK = threading.Lock()
+
+def _feed_epoch() -> str:
+    """
+    SSE id space of a MARKET_FEED replay. Every worker replays the same file in the
+    same order, so version N means the same store state in each of them.
+    """
+    try:
+        st = os.stat(MARKET_FEED)
+        ident = f"{os.path.abspath(MARKET_FEED)}:{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        ident = MARKET_FEED
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()[:10]
+
+@app.before_request
+def _start_feed():
+    """Start the replay feed once per worker process (threads do not survive fork)."""
+    global _FEED_PID
+    if not MARKET_FEED or _FEED_PID == os.getpid():
+        return
+    with _FEED_LOCK:  # concurrent first requests on gthread workers
+        if _FEED_PID == os.getpid():
+            return
+        _FEED_PID = os.getpid()
+        HUB.rebase(_feed_epoch())
+        feed = ReplayFeed(MARKET_FEED, MARKET_FEED_INTERVAL, loop=MARKET_FEED_INTERVAL > 0)
+        threading.Thread(target=ingest, args=(feed, MARKET), daemon=True).start()
 
 # =========================
-# Static index
+# Static assets (fingerprinted)
 # =========================
+# Every file under static/ gets a content hash; /assets/<name>.<hash>.<ext> is
+# served with immutable long-lived caching, text assets from memory with
+# gzip/brotli variants built once. index.html is rewritten to point at the
+# hashed URLs and itself always revalidates. `flask build-assets` writes the
+# manifest and .gz/.br siblings for nginx gzip_static/brotli_static.
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+INDEX_CACHE_CONTROL = "no-cache"
+TEXT_ASSETS = (".html", ".js", ".css", ".svg", ".json", ".txt")
+
+_ASSET_HASHES: dict = {}  # rel path -> ((mtime_ns, size), hash)
+_ASSET_LOCK = threading.Lock()
+
+def asset_hash(rel: str) -> Optional[str]:
+    """Content hash of static/<rel>; re-hashed only when mtime/size change. None if missing/outside static/."""
+    path = safe_join(app.static_folder, rel)
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = _ASSET_HASHES.get(rel)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b""):
+            h.update(chunk)
+    digest = h.hexdigest()[:12]
+    with _ASSET_LOCK:
+        _ASSET_HASHES[rel] = (stamp, digest)
+    return digest
+
+def asset_manifest() -> dict:
+    out = {}
+    for dirpath, _dirs, files in os.walk(app.static_folder):
+        for f in files:
+            if f.endswith((".gz", ".br")) or f == "manifest.json":
+                continue
+            rel = os.path.relpath(os.path.join(dirpath, f), app.static_folder).replace(os.sep, "/")
+            out[rel] = asset_hash(rel)
+    return out
+
+def asset_url(rel: str) -> str:
+    h = asset_hash(rel)
+    if h is None:
+        return f"/static/{rel}"
+    stem, ext = os.path.splitext(rel)
+    return f"/assets/{stem}.{h}{ext}"
+
+def share_version(style: str = DEFAULT_STYLE) -> str:
+    """Fingerprint of a style's share images: its layouts, plus the bg file for neo."""
+    style = _norm_style(style)
+    parts = [APP_ASSET_VERSION, layout_plan("top", style).digest, layout_plan("pair", style).digest]
+    if style == "neo":
+        parts.append(asset_hash(os.path.relpath(BG_PATH, app.static_folder)) or "")
+    return hashlib.sha256(":".join(parts).encode()).hexdigest()[:10]
+
+_STATIC_REF = re.compile(rb'((?:src|href)=")/static/([^"?#]+)"')
+
+@lru_cache(maxsize=64)
+def _static_refs(rel: str, h: str) -> tuple:
+    """Assets referenced as /static/... from an HTML asset (per content hash)."""
+    with open(os.path.join(app.static_folder, rel), "rb") as fh:
+        return tuple(m.group(2).decode() for m in _STATIC_REF.finditer(fh.read()))
+
+def _asset_entry(rel: str, h: str) -> dict:
+    """In-memory body + precompressed variants of a text asset, keyed by its hash."""
+    html = rel.endswith(".html")
+    refs = tuple(asset_hash(r) for r in _static_refs(rel, h)) if html else ()
+
+    path = safe_join(app.static_folder, rel)
+    if path is None:
+        abort(404)
+
+    def build():
+        with open(path, "rb") as fh:
+            body = fh.read()
+        if html:
+            body = _STATIC_REF.sub(
+                lambda m: m.group(1) + asset_url(m.group(2).decode()).encode() + b'"', body)
+        return body
+    return _body_entry(("asset", rel, h, refs), build, raw=True)
+
+@app.get("/assets/<path:filename>")
+def hashed_asset(filename):
+    stem, ext = os.path.splitext(filename)
+    rel, _, h = stem.rpartition(".")
+    rel += ext
+    current = asset_hash(rel) if rel else None
+    if current is None:
+        abort(404)
+    if h != current:
+        # stale hash (old page still cached somewhere): serve the current file, but not as immutable
+        resp = send_from_directory(app.static_folder, rel)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
+    if rel.endswith(TEXT_ASSETS):
+        mimetype = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        return _serve_entry(_asset_entry(rel, h), mimetype, ASSET_CACHE_CONTROL)
+    resp = send_from_directory(app.static_folder, rel, max_age=31536000)
+    resp.headers["Cache-Control"] = ASSET_CACHE_CONTROL
+    return resp
+
 @app.route("/")
 def index():
-    return send_from_directory(app.static_folder, "index.html")
+    h = asset_hash("index.html")
+    return _serve_entry(_asset_entry("index.html", h), "text/html", INDEX_CACHE_CONTROL)
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Write static/manifest.json and .gz/.br siblings of the text assets."""
+    manifest = asset_manifest()
+    for rel in manifest:
+        if not rel.endswith(TEXT_ASSETS):
+            continue
+        entry = _asset_entry(rel, manifest[rel])
+        path = os.path.join(app.static_folder, rel)
+        for enc, ext in (("gzip", ".gz"), ("br", ".br")):
+            if enc in entry:
+                _write_atomic(path + ext, entry[enc])
+    manifest = {rel: asset_url(rel) for rel in manifest}
+    _write_atomic(os.path.join(app.static_folder, "manifest.json"),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    click.echo(f"build-assets: {len(manifest)} assets fingerprinted")
 
 # =========================
 # API for frontend
 # =========================
+BODY_CACHE_MAX = int(os.environ.get("BODY_CACHE_MAX", "1024"))
+BODY_COMPRESS_MIN = 256  # bytes; smaller bodies are sent as-is
+API_CACHE_CONTROL = "no-cache"  # always revalidate; unchanged data costs a 304
+
+_BODY_CACHE: "OrderedDict[tuple, dict]" = OrderedDict()
+_BODY_CACHE_LOCK = threading.Lock()
+
+def _body_entry(key: tuple, build, raw=False, compress=True) -> dict:
+    """
+    Serialized body, precompressed variants and ETag for `key`, where key
+    carries the data version so a changed store never hits a stale entry.
+    `build` returns an object to JSON-encode, or with raw=True ready bytes.
+    """
+    with _BODY_CACHE_LOCK:
+        entry = _BODY_CACHE.get(key)
+        if entry is not None:
+            _BODY_CACHE.move_to_end(key)
+            metric_inc("cache_requests_total", cache="body", result="hit")
+            return entry
+    metric_inc("cache_requests_total", cache="body", result="miss")
+    body = build() if raw else (app.json.dumps(build()) + "\n").encode("utf-8")
+    etag = hashlib.sha256(body).hexdigest()[:32]
+    entry = {"identity": body, "etag": etag}
+    if compress and len(body) >= BODY_COMPRESS_MIN:
+        entry["gzip"] = gzip.compress(body, 6, mtime=0)
+        if brotli is not None:
+            entry["br"] = brotli.compress(body)
+    with _BODY_CACHE_LOCK:
+        _BODY_CACHE[key] = entry
+        while len(_BODY_CACHE) > BODY_CACHE_MAX:
+            _BODY_CACHE.popitem(last=False)
+    return entry
+
+def _json_fragment(key: tuple, build) -> bytes:
+    """Serialized JSON value (no compression) for splicing into batch responses."""
+    return _body_entry(("frag",) + key, build, compress=False)["identity"].rstrip(b"\n")
+
+def cached_json(key: tuple, build, raw=False):
+    return _serve_entry(_body_entry(key, build, raw=raw), "application/json", API_CACHE_CONTROL)
+
+def _serve_entry(entry: dict, mimetype: str, cache_control: str):
+    """Serve a cached body in the best encoding the client accepts."""
+    accept = request.accept_encodings
+    for enc in ("br", "gzip"):
+        if enc in entry and accept[enc]:
+            break
+    else:
+        enc = "identity"
+    resp = Response(entry[enc], mimetype=mimetype)
+    if enc != "identity":
+        resp.headers["Content-Encoding"] = enc
+    resp.set_etag(entry["etag"] if enc == "identity" else f'{entry["etag"]}-{enc}')
+    resp.vary.add("Accept-Encoding")
+    resp.headers["Cache-Control"] = cache_control
+    return resp.make_conditional(request)
+
+PAGE_LIMIT_DEFAULT, PAGE_LIMIT_MAX = 50, 500
+
 @app.get("/api/pairs")
 def get_pairs():
-    return jsonify({"items": PAIRS})
+    try:
+        limit = max(1, min(PAGE_LIMIT_MAX, int(request.args.get("limit", PAGE_LIMIT_DEFAULT))))
+        cursor = request.args.get("cursor")
+        items, nxt, version = MARKET.page_versioned(limit, cursor)
+    except ValueError:
+        return jsonify({"error": "Bad limit or cursor"}), 400
+    return cached_json(("pairs", version, limit, cursor),
+                       lambda: {"items": items, "next_cursor": nxt})
 
 @app.get("/api/pair/<symbol>")
 def get_pair(symbol: str):
     sym = symbol.upper()
-    if sym in DETAILS:
-        return jsonify(DETAILS[sym])
+    d, version = MARKET.get_versioned(sym)
+    if d is not None:
+        return cached_json(("pair", sym, version), lambda: d)
     return jsonify({"error": "Not found"}), 404
 
+@app.get("/api/pair/<symbol>/history")
+def get_pair_history(symbol: str):
+    sym = symbol.upper()
+    if sym not in MARKET:
+        return jsonify({"error": "Not found"}), 404
+    try:
+        points = max(2, min(HISTORY_POINTS_MAX, int(request.args.get("points", HISTORY_POINTS_DEFAULT))))
+    except ValueError:
+        return jsonify({"error": "Bad points"}), 400
+
+    def build():
+        t, p = HISTORY.downsample(sym, points)
+        return {"symbol": sym, "points": len(p), "t": [round(x, 3) for x in t], "price": p}
+    return cached_json(("history", sym, MARKET.symbol_version(sym), points), build)
+
 # =========================
 # Pillow helpers
 # =========================
-def _font(size: int):
-    try:
-        return ImageFont.truetype("DejaVuSans.ttf", size)
-    except Exception:
-        return ImageFont.load_default()
-
-def _text_w(draw: ImageDraw.ImageDraw, text: str, size: int) -> float:
-    return draw.textlength(text, font=_font(size))
-
-def _fit_text(draw, text, max_width, base_size, min_size=14, step=-2):
-    s = base_size
-    while s >= min_size:
-        f = _font(s)
-        if draw.textlength(text, font=f) <= max_width:
-            return f
-        s += step
-    return _font(min_size)
-
-def _draw_kv(draw: ImageDraw.ImageDraw, x, y, k, v,
-             k_color=(160,170,185), v_color=(230,230,235),
-             f1=28, f2=32, right=80, total_w=1200):
-    draw.text((x, y), k, font=_font(f1), fill=k_color)
-    w = draw.textlength(v, font=_font(f2))
-    draw.text((total_w - right - w, y - 4), v, font=_font(f2), fill=v_color)
+FONT_FACE = "DejaVuSans.ttf"
+_FONTS: dict = {}
+_FONTS_LOCK = threading.Lock()
+
+def _font(size: int, face: str = FONT_FACE):
+    """Process-wide font registry: each (face, size) is parsed from disk once."""
+    key = (face, size)
+    f = _FONTS.get(key)
+    if f is not None:
+        return f
+    with _FONTS_LOCK:
+        f = _FONTS.get(key)
+        if f is None:
+            with span("font"):
+                try:
+                    f = ImageFont.truetype(face, size)
+                except Exception:
+                    f = ImageFont.load_default()
+            _FONTS[key] = f
+    return f
+
+@lru_cache(maxsize=8192)
+def _text_len(text: str, size: int, face: str = FONT_FACE) -> float:
+    return _font(size, face).getlength(text)
+
+@lru_cache(maxsize=2048)
+def _fit_size(text, max_width, base_size, min_size=14, step=-2) -> int:
+    """Largest size in base_size, base_size+step, ... >= min_size that fits max_width."""
+    sizes = list(range(base_size, min_size - 1, step))
+    lo, hi, best = 0, len(sizes) - 1, min_size
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if _text_len(text, sizes[mid]) <= max_width:
+            best, hi = sizes[mid], mid - 1
+        else:
+            lo = mid + 1
+    return best
 
 def _get_bg_rgba() -> Image.Image:
     """Load 1200x630 bg from static/share_bg/neo_bg.png; fall back to gradient."""
+    with span("bg"):
+        return _load_bg()
+
+def _load_bg() -> Image.Image:
     W, H = 1200, 630
-    p = os.path.join(app.root_path, "static", "share_bg", "neo_bg.png")
+    p = BG_PATH
     if os.path.exists(p):
         bg = Image.open(p).convert("RGBA").resize((W, H), Image.LANCZOS)
     else:
@@ -160,125 +845,56 @@ def _draw_coin_badge(draw, cx, cy, symbol: str, r=16):
     # ticker text
     t = (symbol or "?")[:4]
     f = _font(14)
-    w = draw.textlength(t, font=f)
+    w = _text_len(t, 14)
     draw.text((cx - w/2, cy - 8), t, font=f, fill=(245,245,250,255))
 
 # =========================
-# RENDERERS
+# Static-layer templates
 # =========================
-def render_top_classic(items):
-    W, H = 1200, 630
-    img = Image.new("RGB", (W, H), (17, 26, 33)).convert("RGBA")
-    ov  = _rounded_overlay((40,40,1160,590), radius=24, fill=(31,36,48,255))
-    img.alpha_composite(ov, (40,40))
-    d = ImageDraw.Draw(img)
-    d.text((80, 70), "Best Performing Overall", font=_font(44), fill=(230,230,235,255))
-    y = 140
-    for it in items[:5]:
-        y2 = y + 80
-        rr = _rounded_overlay((0,0,1040,80), radius=14, fill=(39,48,64,255))
-        img.alpha_composite(rr, (80, y))
-        d.text((100, y+22), str(it["rank"]), font=_font(28), fill=(150,160,173,255))
-        d.text((160, y+14), it["symbol"], font=_font(30), fill=(235,235,240,255))
-        d.text((160, y+44), it["name"],   font=_font(22), fill=(150,160,173,255))
-        score = f'{it["score"]}% Score'; apy = f'{it["apy"]}% APY'
-        w1 = _text_w(d, score, 24); w2 = _text_w(d, apy, 24)
-        d.text((1120- w1 - w2 - 28, y+26), score, font=_font(24), fill=(110,220,170,255))
-        d.text((1120- w2,            y+26), apy,   font=_font(24), fill=(110,220,170,255))
-        y = y2 + 12
-        if y > 520: break
-    buf = BytesIO(); img.save(buf, "PNG"); buf.seek(0); return buf
+CANVAS_W, CANVAS_H = 1200, 630
 
-def render_pair_classic(dct: dict):
-    W, H = 1200, 630
-    img = Image.new("RGB", (W, H), (17, 26, 33)).convert("RGBA")
+_TEMPLATES: dict = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+def _bg_stamp():
+    """Identity of the background file on disk; changes when it is replaced."""
+    try:
+        st = os.stat(BG_PATH)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _template_ref(kind: str, style: str, build, *args) -> Image.Image:
+    """
+    Shared (read-only) data-independent layer for (kind, style, *args).
+    Built once per APP_ASSET_VERSION (and per bg file revision for neo).
+    """
+    key = (kind, style) + args
+    stamp = (APP_ASSET_VERSION, _bg_stamp() if style == "neo" else None)
+    hit = _TEMPLATES.get(key)
+    if hit is None or hit[0] != stamp:
+        with _TEMPLATES_LOCK:
+            hit = _TEMPLATES.get(key)
+            if hit is None or hit[0] != stamp:
+                hit = (stamp, build(*args))
+                _TEMPLATES[key] = hit
+    return hit[1]
+
+def _template(kind: str, style: str, build, *args) -> Image.Image:
+    return _template_ref(kind, style, build, *args).copy()
+
+def _base_classic() -> Image.Image:
+    img = Image.new("RGB", (CANVAS_W, CANVAS_H), (17, 26, 33)).convert("RGBA")
     ov  = _rounded_overlay((40,40,1160,590), radius=24, fill=(31,36,48,255))
     img.alpha_composite(ov, (40,40))
-    d = ImageDraw.Draw(img)
-    head = f'{dct["name"]} ({dct["symbol"]})'
-    d.text((80, 70), head, font=_font(44), fill=(235,235,240,255))
-    d.text((80, 120), f'Trading Score {dct["score"]}%', font=_font(26), fill=(110,220,170,255))
-    price_line = f'${dct["price"]:,.2f}'
-    d.text((80, 180), price_line, font=_font(56), fill=(235,235,240,255))
-    px_w = _text_w(d, price_line, 56)
-    ch = "▲" if dct["change_pct"] >= 0 else "▼"
-    color = (110,220,170,255) if dct["change_pct"] >= 0 else (240,120,120,255)
-    d.text((80 + px_w + 20, 190), f"{ch} {dct['change_pct']}%", font=_font(28), fill=color)
-    base_y = 270
-    _draw_kv(d, 80, base_y +   0, "Binance Volume (24h)", f'${dct["volume_24h"]:,.0f}')
-    _draw_kv(d, 80, base_y +  50, "Cap",                   f'${dct["cap"]:,.0f}')
-    _draw_kv(d, 80, base_y + 100, "Volatility",            f'{dct["volatility"]}%')
-    _draw_kv(d, 80, base_y + 150, "Trend",                 f'{dct["trend_pct"]}%')
-    _draw_kv(d, 80, base_y + 200, "In Channel",            "Yes" if dct["in_channel"] else "No")
-    buf = BytesIO(); img.save(buf, "PNG"); buf.seek(0); return buf
+    return img
 
-def render_top_neo(items):
-    """Top-5 over photographic/illustrative background."""
-    W, H = 1200, 630
-    bg = _get_bg_rgba()
-    img = bg.copy()
+def _base_neo() -> Image.Image:
+    img = _get_bg_rgba()
     # translucent content card
     ov = _rounded_overlay((40,40,1160,590), radius=28, fill=(18,22,30,200))
     img.alpha_composite(ov, (40,40))
-    d = ImageDraw.Draw(img)
-    # header
-    title = "TOP 5 CRYPTO"
-    d.text((80, 70), title, font=_fit_text(d, title, 740, 64), fill=(236,240,244,255))
-    d.text((80, 128), "Best Performing Overall", font=_font(26), fill=(168,176,190,255))
-    # list container
-    list_ov = _rounded_overlay((70,180,1130,500), radius=20, fill=(26,32,44,180))
-    img.alpha_composite(list_ov, (70,180))
-    y = 195
-    for it in items[:5]:
-        row = _rounded_overlay((0,0,1040,52), radius=12, fill=(36,44,58,210))
-        img.alpha_composite(row, (90, y))
-        # coin badge + rank
-        d.text((106, y+16), f"{it['rank']}", font=_font(18), fill=(160,170,185,255))
-        _draw_coin_badge(d, 145, y+26, it["symbol"], r=15)
-        # symbol/name
-        d.text((170, y+8),  it["symbol"], font=_font(24), fill=(236,240,244,255))
-        d.text((170, y+28), it["name"],   font=_font(16), fill=(160,170,185,255))
-        # right side badges
-        score = f"{it['score']}% Score"; apy = f"{it['apy']}% APY"
-        w2 = _text_w(d, apy, 20); w1 = _text_w(d, score, 20); px = 1110
-        d.text((px - w2,           y+16), apy,   font=_font(20), fill=(120,230,180,255))
-        d.text((px - w2 - 18 - w1, y+16), score, font=_font(20), fill=(120,230,180,255))
-        y += 60
-    # footer
-    tagline = "See details in GT-App and trade smarter"
-    tf = _fit_text(d, tagline, W-200, 26); tw = d.textlength(tagline, font=tf)
-    d.text(((W-tw)//2, 510), tagline, font=tf, fill=(210,220,235,230))
-    buf = BytesIO(); img.convert("RGB").save(buf, "PNG"); buf.seek(0); return buf
-
-def render_pair_neo(dct: dict):
-    W, H = 1200, 630
-    bg = _get_bg_rgba()
-    img = bg.copy()
-    ov = _rounded_overlay((40,40,1160,590), radius=28, fill=(18,22,30,200))
-    img.alpha_composite(ov, (40,40))
-    d = ImageDraw.Draw(img)
-    # header + badge
-    head = f'{dct["name"]} ({dct["symbol"]})'
-    d.text((80, 70), head, font=_fit_text(d, head, 760, 56), fill=(236,240,244,255))
-    d.text((80, 124), f'Trading Score {dct["score"]}%', font=_font(26), fill=(120,230,180,255))
-    _draw_coin_badge(d, 40+1060, 70, dct["symbol"], r=18)  # маленький бейдж справа-верх
-    # price + change
-    price_line = f'${dct["price"]:,.2f}'
-    d.text((80, 180), price_line, font=_font(60), fill=(236,240,244,255))
-    px_w = _text_w(d, price_line, 60)
-    ch = "▲" if dct["change_pct"] >= 0 else "▼"
-    color = (120,230,180,255) if dct["change_pct"] >= 0 else (240,120,120,255)
-    d.text((80 + px_w + 20, 192), f"{ch} {dct['change_pct']}%", font=_font(30), fill=color)
-    # divider
-    d.rounded_rectangle((80, 232, 1120, 246), radius=8, fill=(60,66,80,200))
-    # k/v grid
-    base_y = 270
-    _draw_kv(d, 80, base_y +   0, "Binance Volume (24h)", f'${dct["volume_24h"]:,.0f}', k_color=(175,180,195), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y +  50, "Cap",                   f'${dct["cap"]:,.0f}',        k_color=(175,180,195), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y + 100, "Volatility",            f'{dct["volatility"]}%',      k_color=(175,180,195), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y + 150, "Trend",                 f'{dct["trend_pct"]}%',       k_color=(175,180,195), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y + 200, "In Channel",            "Yes" if dct["in_channel"] else "No", k_color=(175,180,195), v_color=(236,240,244))
-    buf = BytesIO(); img.convert("RGB").save(buf, "PNG"); buf.seek(0); return buf
+    return img
 
 # ====== old violet (optional) ======
 def _linear_gradient(width, height, start_color, end_color):
@@ -292,80 +908,954 @@ def _linear_gradient(width, height, start_color, end_color):
     base.paste(top, (0, 0), mask)
     return base
 
-def render_top_violet(items):
-    W, H = 1200, 630
-    img = _linear_gradient(W, H, (12,10,20), (30,15,60)).convert("RGBA")
+def _base_violet() -> Image.Image:
+    img = _linear_gradient(CANVAS_W, CANVAS_H, (12,10,20), (30,15,60)).convert("RGBA")
     ov = _rounded_overlay((40,40,1160,590), radius=28, fill=(26,20,46,255))
     img.alpha_composite(ov, (40,40))
-    d = ImageDraw.Draw(img)
-    d.text((80, 70), "TOP 5 CRYPTO!", font=_fit_text(d, "TOP 5 CRYPTO!", 700, 72), fill=(245,240,255,255))
-    d.text((80, 130), "Best Performing Overall", font=_font(28), fill=(180,165,230,255))
-    list_ov = _rounded_overlay((70,180,1130,500), radius=22, fill=(36,28,64,255))
-    img.alpha_composite(list_ov, (70,180))
-    y = 195
-    for it in items[:5]:
-        row = _rounded_overlay((0,0,1040,52), radius=12, fill=(46,38,78,255))
-        img.alpha_composite(row, (90, y))
-        d.text((106, y+14), f"#{it['rank']}", font=_font(22), fill=(160,150,210,255))
-        d.text((170, y+8),  it["symbol"], font=_font(26), fill=(245,242,255,255))
-        d.text((170, y+30), it["name"],   font=_font(18), fill=(170,160,210,255))
-        score = f"{it['score']}% Score"; apy = f"{it['apy']}% APY"
-        w2 = _text_w(d, apy, 22); w1 = _text_w(d, score, 22); px = 1110
-        d.text((px - w2,           y+14), apy,   font=_font(22), fill=(120,230,180,255))
-        d.text((px - w2 - 20 - w1, y+14), score, font=_font(22), fill=(120,230,180,255))
-        y += 56
-    buf = BytesIO(); img.convert("RGB").save(buf, "PNG"); buf.seek(0); return buf
+    return img
+
+# =========================
+# Layout specs
+# =========================
+# A layout is {"base": fn, "static": [...], "ops": [...]}. "static" ops are baked
+# into the template, "ops" are bound to data per request. Text values containing
+# "{field}" are slots filled with str.format_map; everything else is resolved once
+# in compile_layout(). Alignment: left | right (x is the right edge) | center
+# (on the canvas) | after / before (relative to the previous text op, with gap).
+# fill may be ("flag", if_true, if_false) to pick a colour from the data.
+SPARK_RECT = (720, 128, 1120, 220)  # pair cards: right of score/price, pushed right by long prices
+def _t(x, y, text, size=None, fit=None, fill=(255,255,255,255), align="left", gap=0):
+    return {"op": "text", "x": x or 0, "y": y, "text": text, "size": size,
+            "fit": fit, "fill": fill, "align": align, "gap": gap}
+
+def _box(rect, radius, fill):
+    return {"op": "overlay", "rect": rect, "radius": radius, "fill": fill}
+
+def _rrect(rect, radius, fill):
+    return {"op": "rrect", "rect": rect, "radius": radius, "fill": fill}
+
+def _badge(cx, cy, text, r):
+    return {"op": "badge", "x": cx, "y": cy, "text": text, "size": r}
+
+def _spark(rect, fill, width=3, gap=32, min_w=120):
+    """
+    Price line from the payload's "spark" list, scaled to fill rect. The left edge
+    starts at least `gap` after the previous text op and the top clears any text above
+    that reaches over the rect; narrower than min_w or under half height -> not drawn.
+    """
+    return {"op": "spark", "rect": rect, "fill": fill, "width": width, "gap": gap, "min_w": min_w}
+
+def _rows(y, step, ops, count=5):
+    """Repeat `ops` for list items; their y/rect coordinates are row-relative."""
+    return {"op": "rows", "y": y, "step": step, "ops": ops, "count": count}
+
+KV_LABELS = ("Binance Volume (24h)", "Cap", "Volatility", "Trend", "In Channel")
+KV_VALUES = ("${volume_24h:,.0f}", "${cap:,.0f}", "{volatility}%", "{trend_pct}%", "{in_channel_yn}")
+
+def _kv_labels(k_color):
+    return [_t(80, 270 + 50 * i, k, size=28, fill=k_color) for i, k in enumerate(KV_LABELS)]
+
+def _kv_values(v_color):
+    return [_t(1120, 266 + 50 * i, v, size=32, fill=v_color, align="right")
+            for i, v in enumerate(KV_VALUES)]
+
+LAYOUTS = {
+    ("top", "classic"): {
+        "base": _base_classic,
+        "static": [
+            _t(80, 70, "Best Performing Overall", size=44, fill=(230,230,235,255)),
+            _rows(140, 92, [_box((80,0,1120,80), 14, (39,48,64,255))]),
+        ],
+        "ops": [
+            _rows(140, 92, [
+                _t(100, 22, "{rank}",   size=28, fill=(150,160,173,255)),
+                _t(160, 14, "{symbol}", size=30, fill=(235,235,240,255)),
+                _t(160, 44, "{name}",   size=22, fill=(150,160,173,255)),
+                _t(1120, 26, "{apy}% APY",     size=24, fill=(110,220,170,255), align="right"),
+                _t(None, 26, "{score}% Score", size=24, fill=(110,220,170,255), align="before", gap=28),
+            ]),
+        ],
+    },
+    ("pair", "classic"): {
+        "base": _base_classic,
+        "static": _kv_labels((160,170,185)),
+        "ops": [
+            _t(80, 70,  "{name} ({symbol})",     size=44, fill=(235,235,240,255)),
+            _t(80, 120, "Trading Score {score}%", size=26, fill=(110,220,170,255)),
+            _t(80, 180, "${price:,.2f}",          size=56, fill=(235,235,240,255)),
+            _t(None, 190, "{arrow} {change_pct}%", size=28, align="after", gap=20,
+               fill=("up", (110,220,170,255), (240,120,120,255))),
+            _spark(SPARK_RECT, ("up", (110,220,170,255), (240,120,120,255))),
+        ] + _kv_values((230,230,235)),
+    },
+    ("top", "neo"): {
+        "base": _base_neo,
+        "static": [
+            _t(80, 70, "TOP 5 CRYPTO", fit=(740, 64), fill=(236,240,244,255)),
+            _t(80, 128, "Best Performing Overall", size=26, fill=(168,176,190,255)),
+            _box((70,180,1130,500), 20, (26,32,44,180)),
+            _rows(195, 60, [_box((90,0,1130,52), 12, (36,44,58,210))]),
+            _t(None, 510, "See details in GT-App and trade smarter", fit=(CANVAS_W-200, 26),
+               fill=(210,220,235,230), align="center"),
+        ],
+        "ops": [
+            _rows(195, 60, [
+                _t(106, 16, "{rank}", size=18, fill=(160,170,185,255)),
+                _badge(145, 26, "{symbol}", 15),
+                _t(170, 8,  "{symbol}", size=24, fill=(236,240,244,255)),
+                _t(170, 28, "{name}",   size=16, fill=(160,170,185,255)),
+                _t(1110, 16, "{apy}% APY",     size=20, fill=(120,230,180,255), align="right"),
+                _t(None, 16, "{score}% Score", size=20, fill=(120,230,180,255), align="before", gap=18),
+            ]),
+        ],
+    },
+    ("pair", "neo"): {
+        "base": _base_neo,
+        "static": _kv_labels((175,180,195)),
+        "ops": [
+            _t(80, 70,  "{name} ({symbol})", fit=(760, 56), fill=(236,240,244,255)),
+            _t(80, 124, "Trading Score {score}%", size=26, fill=(120,230,180,255)),
+            _badge(1100, 70, "{symbol}", 18),  # маленький бейдж справа-верх
+            _t(80, 180, "${price:,.2f}", size=60, fill=(236,240,244,255)),
+            _t(None, 192, "{arrow} {change_pct}%", size=30, align="after", gap=20,
+               fill=("up", (120,230,180,255), (240,120,120,255))),
+            # divider stays dynamic: it is painted over the price descenders
+            _rrect((80,232,1120,246), 8, (60,66,80,200)),
+            _spark(SPARK_RECT, ("up", (120,230,180,255), (240,120,120,255))),
+        ] + _kv_values((236,240,244)),
+    },
+    ("top", "violet"): {
+        "base": _base_violet,
+        "static": [
+            _t(80, 70, "TOP 5 CRYPTO!", fit=(700, 72), fill=(245,240,255,255)),
+            _t(80, 130, "Best Performing Overall", size=28, fill=(180,165,230,255)),
+            _box((70,180,1130,500), 22, (36,28,64,255)),
+            _rows(195, 56, [_box((90,0,1130,52), 12, (46,38,78,255))]),
+        ],
+        "ops": [
+            _rows(195, 56, [
+                _t(106, 14, "#{rank}",  size=22, fill=(160,150,210,255)),
+                _t(170, 8,  "{symbol}", size=26, fill=(245,242,255,255)),
+                _t(170, 30, "{name}",   size=18, fill=(170,160,210,255)),
+                _t(1110, 14, "{apy}% APY",     size=22, fill=(120,230,180,255), align="right"),
+                _t(None, 14, "{score}% Score", size=22, fill=(120,230,180,255), align="before", gap=20),
+            ]),
+        ],
+    },
+    ("pair", "violet"): {
+        "base": _base_violet,
+        "static": _kv_labels((175,170,210)),
+        "ops": [
+            _t(80, 70,  "{name} ({symbol})", fit=(700, 56), fill=(245,242,255,255)),
+            _t(80, 120, "Trading Score {score}%", size=28, fill=(120,230,180,255)),
+            _t(80, 180, "${price:,.2f}", size=60, fill=(245,245,248,255)),
+            _t(None, 192, "{arrow} {change_pct}%", size=30, align="after", gap=20,
+               fill=("up", (120,230,180,255), (240,120,120,255))),
+            _spark(SPARK_RECT, ("up", (120,230,180,255), (240,120,120,255))),
+        ] + _kv_values((236,240,244)),
+    },
+}
+
+# =========================
+# Layout compiler
+# =========================
+# row: list item index (-1 = top-level data); w: precomputed width of static text
+PlanOp = namedtuple("PlanOp", "kind row x y align gap text slot size fit font w fill extra")
+Plan = namedtuple("Plan", "base static ops digest")
+
+def _compile_ops(ops, row=-1, dy=0):
+    out = []
+    for o in ops:
+        kind = o["op"]
+        if kind == "rows":
+            for i in range(o["count"]):
+                out += _compile_ops(o["ops"], row=i, dy=dy + o["y"] + o["step"] * i)
+        elif kind == "text":
+            text, fit, size = o["text"], o["fit"], o["size"]
+            slot = "{" in text
+            x, align, font, w = o["x"], o["align"], None, None
+            if not slot:
+                if fit:
+                    size, fit = _fit_size(text, fit[0], fit[1]), None
+                w = _text_len(text, size)
+                if align == "right":
+                    x, align = x - w, "left"
+                elif align == "center":
+                    x, align = (CANVAS_W - w) // 2, "left"
+            if not fit:
+                font = _font(size)
+            out.append(PlanOp("text", row, x, o["y"] + dy, align, o["gap"], text, slot,
+                              size, fit, font, w, o["fill"], None))
+        elif kind == "overlay":
+            x1, y1, x2, y2 = o["rect"]
+            ov = _rounded_overlay((x1, y1, x2, y2), radius=o["radius"], fill=o["fill"])
+            out.append(PlanOp("overlay", row, x1, y1 + dy, "left", 0, "", False,
+                              None, None, None, None, None, ov))
+        elif kind == "rrect":
+            x1, y1, x2, y2 = o["rect"]
+            out.append(PlanOp("rrect", row, x1, y1 + dy, "left", 0, "", False, o["radius"],
+                              None, None, None, o["fill"], (x1, y1 + dy, x2, y2 + dy)))
+        elif kind == "badge":
+            out.append(PlanOp("badge", row, o["x"], o["y"] + dy, "left", 0, o["text"], True,
+                              o["size"], None, None, None, None, None))
+        elif kind == "spark":
+            x1, y1, x2, y2 = o["rect"]
+            out.append(PlanOp("spark", row, x1, y1 + dy, "after", o["gap"], "spark", True, o["width"],
+                              None, None, o["min_w"], o["fill"], (x1, y1 + dy, x2, y2 + dy)))
+        else:
+            raise ValueError(f"Unknown layout op: {kind}")
+    return tuple(out)
+
+@lru_cache(maxsize=None)
+def layout_plan(kind: str, style: str) -> Plan:
+    """Compile LAYOUTS[(kind, style)] once: fonts, static widths and offsets resolved."""
+    spec = LAYOUTS[(kind, style)]
+    digest = hashlib.sha256(json.dumps(
+        spec, sort_keys=True, default=lambda f: f.__name__).encode("utf-8")).hexdigest()
+    return Plan(spec["base"], _compile_ops(spec["static"]), _compile_ops(spec["ops"]), digest)
+
+def _text_bbox(text: str, size: int, x, y):
+    l, t, r, b = _font_bbox(text, size)
+    return (int(x + l) - 2, int(y + t) - 2, int(x + r) + 3, int(y + b) + 3)
+
+@lru_cache(maxsize=8192)
+def _font_bbox(text: str, size: int):
+    return _font(size).getbbox(text)
+
+def _spark_points(values, rect) -> tuple:
+    """Scale a price list into rect (one x step per point, min..max on y)."""
+    if len(values) < 2:
+        return ()
+    x1, y1, x2, y2 = rect
+    lo, hi = min(values), max(values)
+    dx = (x2 - x1) / (len(values) - 1)
+    if hi == lo:
+        return tuple((round(x1 + i * dx), (y1 + y2) // 2) for i in range(len(values)))
+    ky = (y2 - y1) / (hi - lo)
+    return tuple((round(x1 + i * dx), round(y2 - (v - lo) * ky)) for i, v in enumerate(values))
+
+def _resolve_ops(ops, data: dict, items):
+    """
+    Bind data into plan ops -> [(kind, sig, bbox, extra)]. `sig` fully describes
+    what gets painted, `bbox` covers every pixel the op can touch.
+    """
+    cmds = []
+    prev_x = prev_w = 0
+    rows = len(items)
+    for op in ops:
+        if op.row < 0:
+            src = data
+        elif op.row < rows:
+            src = items[op.row]
+        else:
+            continue
+        fill = op.fill
+        if fill is not None and isinstance(fill[0], str):
+            fill = fill[1] if src[fill[0]] else fill[2]
+        kind = op.kind
+        if kind == "text":
+            if op.slot:
+                text = op.text.format_map(src)
+                size = _fit_size(text, op.fit[0], op.fit[1]) if op.fit else op.size
+                font = op.font or _font(size)
+                w = _text_len(text, size)
+            else:
+                text, size, font, w = op.text, op.size, op.font, op.w
+            x = op.x
+            if op.align == "right":
+                x -= w
+            elif op.align == "center":
+                x = (CANVAS_W - w) // 2
+            elif op.align == "after":
+                x = prev_x + prev_w + op.gap
+            elif op.align == "before":
+                x = prev_x - op.gap - w
+            cmds.append(("text", (x, op.y, text, size, fill), _text_bbox(text, size, x, op.y), font))
+            prev_x, prev_w = x, w
+        elif kind == "overlay":
+            ov = op.extra
+            cmds.append(("overlay", (op.x, op.y), (op.x, op.y, op.x + ov.width, op.y + ov.height), ov))
+        elif kind == "rrect":
+            cmds.append(("rrect", (op.extra, op.size, fill), op.extra, None))
+        elif kind == "badge":
+            r = op.size
+            cmds.append(("badge", (op.x, op.y, op.text.format_map(src), r),
+                         (op.x - r - 4, op.y - r - 4, op.x + r + 5, op.y + r + 5), None))
+        elif kind == "spark":
+            x1, y1, x2, y2 = op.extra
+            x1 = max(x1, prev_x + prev_w + op.gap)
+            w = op.size
+            for c in cmds:  # a long header reaching over the rect pushes the line down
+                if c[0] == "text" and c[2][0] < x2 + w and c[2][2] > x1 - w and c[2][1] < y1 < c[2][3] + 2 * w:
+                    y1 = c[2][3] + 2 * w
+            fits = x2 - x1 >= op.w and y2 - y1 >= (op.extra[3] - op.extra[1]) // 2
+            pts = _spark_points(src.get(op.text) or (), (x1, y1, x2, y2)) if fits else ()
+            cmds.append(("spark", (pts, w, fill), (x1 - w, y1 - w, x2 + w + 1, y2 + w + 1), None))
+    return cmds
+
+def _paint(img: Image.Image, d: ImageDraw.ImageDraw, cmds, ox=0, oy=0):
+    """Paint resolved commands; (ox, oy) is the canvas position of img's origin."""
+    for kind, sig, _bbox, extra in cmds:
+        if kind == "text":
+            x, y, text, _size, fill = sig
+            d.text((x - ox, y - oy), text, font=extra, fill=fill)
+        elif kind == "overlay":
+            img.alpha_composite(extra, (sig[0] - ox, sig[1] - oy))
+        elif kind == "rrect":
+            (x1, y1, x2, y2), radius, fill = sig
+            d.rounded_rectangle((x1 - ox, y1 - oy, x2 - ox, y2 - oy), radius=radius, fill=fill)
+        elif kind == "badge":
+            cx, cy, text, r = sig
+            _draw_coin_badge(d, cx - ox, cy - oy, text, r=r)
+        elif kind == "spark":
+            pts, width, fill = sig
+            if pts:
+                # 1px strokes under a "+" brush: wide lines rasterize differently once
+                # translated, which would break byte-identical incremental tiles
+                r = width // 2
+                for bx, by in [(i, 0) for i in range(-r, r + 1)] + [(0, i) for i in range(-r, r + 1) if i]:
+                    d.line([(x - ox + bx, y - oy + by) for x, y in pts], fill=fill, width=1)
+
+def _build_template(plan: Plan, rows: int) -> Image.Image:
+    img = plan.base()
+    _paint(img, ImageDraw.Draw(img), _resolve_ops(plan.static, {}, [{}] * rows))
+    return img
+
+def _pair_fields(dct: dict) -> dict:
+    up = dct["change_pct"] >= 0
+    return dict(dct, up=up, arrow="▲" if up else "▼",
+                in_channel_yn="Yes" if dct["in_channel"] else "No")
+
+# =========================
+# Incremental (dirty-region) pair renders
+# =========================
+# each kept frame is a full RGBA canvas (~3 MB), in every worker and pool child
+INCREMENTAL_FRAMES = int(os.environ.get("INCREMENTAL_FRAMES", "4"))
+
+_FRAMES: "OrderedDict[tuple, tuple]" = OrderedDict()  # (symbol, style) -> (template, cmds, img)
+_FRAMES_LOCK = threading.Lock()
+
+def _merge_rects(rects):
+    """Union overlapping rectangles until none intersect."""
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        while rects:
+            a = rects.pop()
+            for i, b in enumerate(rects):
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    merged = True
+                    break
+            else:
+                out.append(a)
+        rects = out
+    return rects
+
+def _dirty_rects(old_cmds, new_cmds):
+    if len(old_cmds) != len(new_cmds):
+        return None
+    rects = []
+    for o, n in zip(old_cmds, new_cmds):
+        if o[0] != n[0] or o[1] != n[1]:
+            rects += [o[2], n[2]]
+    clamped = []
+    for x1, y1, x2, y2 in rects:
+        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(CANVAS_W, x2), min(CANVAS_H, y2)
+        if x1 < x2 and y1 < y2:
+            clamped.append((x1, y1, x2, y2))
+    return _merge_rects(clamped)
+
+def _render_incremental(plan: Plan, style: str, data: dict) -> Image.Image:
+    """
+    Repaint only the regions whose resolved draw commands changed since the last
+    frame for (symbol, style): restore them from the template, redraw what overlaps.
+    """
+    tpl = _template_ref("pair", style, lambda n: _build_template(plan, n), 0)
+    cmds = _resolve_ops(plan.ops, data, ())
+    key = (data["symbol"], style)
+    with _FRAMES_LOCK:
+        last = _FRAMES.pop(key, None)  # take ownership while painting
+    dirty = None
+    if last is not None and last[0] is tpl:
+        dirty = _dirty_rects(last[1], cmds)
+    if dirty is None:
+        img = tpl.copy()
+        _paint(img, ImageDraw.Draw(img), cmds)
+    else:
+        img = last[2]
+        for x1, y1, x2, y2 in dirty:
+            tile = tpl.crop((x1, y1, x2, y2))
+            hits = [c for c in cmds if c[2][0] < x2 and x1 < c[2][2] and c[2][1] < y2 and y1 < c[2][3]]
+            _paint(tile, ImageDraw.Draw(tile), hits, x1, y1)
+            img.paste(tile, (x1, y1))
+    with _FRAMES_LOCK:
+        _FRAMES[key] = (tpl, cmds, img)
+        while len(_FRAMES) > INCREMENTAL_FRAMES:
+            _FRAMES.popitem(last=False)
+    return img.copy()
+
+def render_plan(kind: str, style: str, payload) -> Image.Image:
+    """Bind payload into the compiled plan on top of the cached template."""
+    with span("draw"):
+        return _render_plan(kind, style, payload)
+
+def _render_plan(kind: str, style: str, payload) -> Image.Image:
+    plan = layout_plan(kind, style)
+    if kind == "pair":
+        data, items = _pair_fields(payload), ()
+        if INCREMENTAL_FRAMES > 0 and not any(op.kind == "overlay" for op in plan.ops):
+            return _render_incremental(plan, style, data)
+    else:
+        data, items = {}, payload[:5]
+    img = _template(kind, style, lambda n: _build_template(plan, n), len(items))
+    _paint(img, ImageDraw.Draw(img), _resolve_ops(plan.ops, data, items))
+    return img
+
+def _encode_png(img: Image.Image) -> BytesIO:
+    with span("encode"):
+        buf = BytesIO(); img.convert("RGB").save(buf, "PNG"); buf.seek(0); return buf
+
+# =========================
+# RENDERERS
+# =========================
+def render_top_classic(items):
+    return _encode_png(render_plan("top", "classic", items))
+
+def render_pair_classic(dct: dict):
+    return _encode_png(render_plan("pair", "classic", dct))
+
+def render_top_neo(items):
+    """Top-5 over photographic/illustrative background."""
+    return _encode_png(render_plan("top", "neo", items))
+
+def render_pair_neo(dct: dict):
+    return _encode_png(render_plan("pair", "neo", dct))
+
+def render_top_violet(items):
+    return _encode_png(render_plan("top", "violet", items))
 
 def render_pair_violet(dct):
-    W,H=1200,630
-    img = _linear_gradient(W,H,(12,10,20),(30,15,60)).convert("RGBA")
-    ov = _rounded_overlay((40,40,1160,590), radius=28, fill=(26,20,46,255))
-    img.alpha_composite(ov, (40,40))
-    d = ImageDraw.Draw(img)
-    head = f'{dct["name"]} ({dct["symbol"]})'
-    d.text((80,70), head, font=_fit_text(d, head, 700, 56), fill=(245,242,255,255))
-    d.text((80,120), f'Trading Score {dct["score"]}%', font=_font(28), fill=(120,230,180,255))
-    price_line = f'${dct["price"]:,.2f}'
-    d.text((80,180), price_line, font=_font(60), fill=(245,245,248,255))
-    px_w = _text_w(d, price_line, 60)
-    ch = "▲" if dct["change_pct"]>=0 else "▼"
-    color = (120,230,180,255) if dct["change_pct"]>=0 else (240,120,120,255)
-    d.text((80+px_w+20,192), f"{ch} {dct['change_pct']}%", font=_font(30), fill=color)
-    base_y=270
-    _draw_kv(d, 80, base_y+0,   "Binance Volume (24h)", f'${dct["volume_24h"]:,.0f}', k_color=(175,170,210), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y+50,  "Cap",                   f'${dct["cap"]:,.0f}',        k_color=(175,170,210), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y+100, "Volatility",            f'{dct["volatility"]}%',      k_color=(175,170,210), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y+150, "Trend",                 f'{dct["trend_pct"]}%',       k_color=(175,170,210), v_color=(236,240,244))
-    _draw_kv(d, 80, base_y+200, "In Channel",            "Yes" if dct["in_channel"] else "No", k_color=(175,170,210), v_color=(236,240,244))
-    buf = BytesIO(); img.convert("RGB").save(buf, "PNG"); buf.seek(0); return buf
+    return _encode_png(render_plan("pair", "violet", dct))
+
+# =========================
+# Render cache
+# =========================
+RENDERERS = {
+    ("top", "classic"):  render_top_classic,
+    ("top", "neo"):      render_top_neo,
+    ("top", "violet"):   render_top_violet,
+    ("pair", "classic"): render_pair_classic,
+    ("pair", "neo"):     render_pair_neo,
+    ("pair", "violet"):  render_pair_violet,
+}
+RENDER_CACHE_MAX = int(os.environ.get("RENDER_CACHE_MAX", "256"))   # entries
+RENDER_CACHE_MB = float(os.environ.get("RENDER_CACHE_MB", "48"))     # bytes per worker (a neo master is ~0.5 MB)
+RENDER_CACHE_DIR = os.environ.get("RENDER_CACHE_DIR")  # shared by all gunicorn workers
+RENDER_CACHE_DIR_MB = float(os.environ.get("RENDER_CACHE_DIR_MB", "512"))  # oldest files pruned past this
+IMAGE_CACHE_CONTROL = "public, max-age=60, s-maxage=600, stale-while-revalidate=300"
+
+_RENDER_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+_RENDER_CACHE_LOCK = threading.Lock()
+_RENDER_CACHE_BYTES = 0
+
+def _norm_style(style: str) -> str:
+    style = (style or DEFAULT_STYLE).lower()
+    return style if style in ("classic", "neo", "violet") else "neo"
+
+def _render_key(kind: str, style: str, payload) -> str:
+    """Content address of a render: same inputs -> same key -> same bytes."""
+    blob = json.dumps(
+        [kind, style, payload, APP_ASSET_VERSION, layout_plan(kind, style).digest,
+         _bg_stamp() if style == "neo" else None],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _cache_get(key: str) -> Optional[bytes]:
+    with _RENDER_CACHE_LOCK:
+        data = _RENDER_CACHE.get(key)
+        if data is not None:
+            _RENDER_CACHE.move_to_end(key)
+            return data
+    if RENDER_CACHE_DIR:
+        path = os.path.join(RENDER_CACHE_DIR, key)
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            os.utime(path)  # mtime = last use, so the sweep drops cold files first
+        except OSError:
+            return None
+        _cache_put(key, data, disk=False)
+    return data
+
+def _cache_put(key: str, data: bytes, disk: bool = True):
+    global _RENDER_CACHE_BYTES
+    cap = RENDER_CACHE_MB * 1024 * 1024
+    with _RENDER_CACHE_LOCK:
+        old = _RENDER_CACHE.pop(key, None)
+        if old is not None:
+            _RENDER_CACHE_BYTES -= len(old)
+        _RENDER_CACHE[key] = data
+        _RENDER_CACHE_BYTES += len(data)
+        while _RENDER_CACHE and (len(_RENDER_CACHE) > RENDER_CACHE_MAX or _RENDER_CACHE_BYTES > cap):
+            _RENDER_CACHE_BYTES -= len(_RENDER_CACHE.popitem(last=False)[1])
+    if disk and RENDER_CACHE_DIR:
+        try:
+            _write_atomic(os.path.join(RENDER_CACHE_DIR, key), data)
+        except OSError:
+            return
+        _disk_sweep(len(data))
+
+_DISK = {"written": 0, "swept": 0.0}
+_DISK_SWEEP_LOCK = threading.Lock()
+
+def _disk_sweep(nbytes: int):
+    """
+    Every price tick writes new keys, so the disk tier is bounded here: after ~10%
+    of the cap has been written (or a minute has passed) one thread per worker scans
+    the directory and deletes least recently used files down to 90% of the cap.
+    """
+    cap = RENDER_CACHE_DIR_MB * 1024 * 1024
+    _DISK["written"] += nbytes
+    if _DISK["written"] < cap / 10 and time.monotonic() - _DISK["swept"] < 60:
+        return
+    if not _DISK_SWEEP_LOCK.acquire(blocking=False):
+        return
+    try:
+        _DISK["written"], _DISK["swept"] = 0, time.monotonic()
+        files, total, now = [], 0, time.time()
+        with os.scandir(RENDER_CACHE_DIR) as it:
+            for e in it:
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                if e.name.endswith(".tmp"):
+                    if now - st.st_mtime > 3600:  # left behind by a crashed writer
+                        files.append((0, st.st_size, e.path))
+                    else:
+                        continue
+                else:
+                    files.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        files.sort()
+        for mtime, size, path in files:
+            if total <= cap * 0.9 and mtime:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # another worker's sweep got there first
+            total -= size
+    except OSError:
+        pass
+    finally:
+        _DISK_SWEEP_LOCK.release()
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+# =========================
+# Render pool (single-flight)
+# =========================
+RENDER_POOL_WORKERS = int(os.environ.get("RENDER_POOL_WORKERS", "0"))  # 0 = render on the request thread
+RENDER_QUEUE_MAX = int(os.environ.get("RENDER_QUEUE_MAX", "32"))
+RENDER_TIMEOUT = float(os.environ.get("RENDER_TIMEOUT", "30"))
+
+class RenderBusy(Exception):
+    """Render queue is full (or the render timed out); the client should retry."""
+
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+_INFLIGHT: dict = {}
+_INFLIGHT_LOCK = threading.Lock()
+_RENDER_STATS = {"renders": 0, "coalesced": 0, "rejected": 0, "shed": 0, "stale": 0,
+                 "seconds": 0.0, "max": 0.0}
+_RENDER_LAT = deque(maxlen=512)
+
+def _render_job(kind: str, style: str, payload):
+    """Runs in the pool (or inline): draw + encode, return (bytes, seconds)."""
+    t0 = time.perf_counter()
+    data = RENDERERS[(kind, style)](payload).getvalue()
+    return data, time.perf_counter() - t0
+
+def _pool():
+    """Per-process pool, created lazily so --preload never forks a live pool."""
+    global _POOL, _POOL_PID
+    if RENDER_POOL_WORKERS <= 0:
+        return None
+    pid = os.getpid()
+    if _POOL is None or _POOL_PID != pid:
+        with _POOL_LOCK:
+            if _POOL is None or _POOL_PID != pid:
+                _POOL = ProcessPoolExecutor(max_workers=RENDER_POOL_WORKERS)
+                _POOL_PID = pid
+    return _POOL
+
+def _record_render(seconds: float):
+    with _INFLIGHT_LOCK:
+        _RENDER_STATS["renders"] += 1
+        _RENDER_STATS["seconds"] += seconds
+        _RENDER_STATS["max"] = max(_RENDER_STATS["max"], seconds)
+        _RENDER_LAT.append(seconds)
+
+def _singleflight(key: str, job, *args) -> bytes:
+    """
+    Concurrent requests for the same key wait on one job.
+    `job(*args)` must return (bytes, seconds) and be picklable for the pool.
+    """
+    with _INFLIGHT_LOCK:
+        fut = _INFLIGHT.get(key)
+        leader = fut is None
+        if leader:
+            if len(_INFLIGHT) >= RENDER_QUEUE_MAX:
+                _RENDER_STATS["rejected"] += 1
+                raise RenderBusy()
+            fut = Future()
+            _INFLIGHT[key] = fut
+        else:
+            _RENDER_STATS["coalesced"] += 1
+    if not leader:
+        # in a request, riding on the render still costs a thread: bounded like a waiter
+        ctx, timeout = (RENDER_GATE.follow(), RENDER_WAIT) if has_request_context() else (nullcontext(), RENDER_TIMEOUT)
+        with ctx:
+            try:
+                with span("coalesced"):
+                    return fut.result(timeout=timeout)
+            except FutureTimeout:
+                raise RenderBusy()
+    try:
+        data = _cache_get(key)  # another leader may have finished in between
+        if data is None:
+            # only leaders take a RENDER_GATE slot; background jobs admit themselves
+            with RENDER_GATE.admit() if has_request_context() else nullcontext():
+                pool = _pool()
+                if pool is None:
+                    data, secs = job(*args)
+                else:
+                    try:
+                        with span("pool"):
+                            data, secs = pool.submit(job, *args).result(timeout=RENDER_TIMEOUT)
+                    except FutureTimeout:
+                        raise RenderBusy()
+            _cache_put(key, data)
+            _record_render(secs)
+        fut.set_result(data)
+        return data
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+
+def render_stats() -> dict:
+    with _INFLIGHT_LOCK:
+        st = dict(_RENDER_STATS)
+        lat = sorted(_RENDER_LAT)
+        st["queue_depth"] = len(_INFLIGHT)
+    st["pool_workers"] = RENDER_POOL_WORKERS
+    st["queue_max"] = RENDER_QUEUE_MAX
+    st["cache_entries"] = len(_RENDER_CACHE)
+    st["cache_mb"] = round(_RENDER_CACHE_BYTES / 1048576, 2)
+    st["concurrency"] = RENDER_GATE.limit
+    st["waiting"] = RENDER_GATE.waiting
+    st["waiters_max"] = RENDER_GATE.waiters
+    st["cpu_count"] = os.cpu_count()
+    st["avg"] = st["seconds"] / st["renders"] if st["renders"] else 0.0
+    st["p50"] = lat[len(lat) // 2] if lat else 0.0
+    st["p95"] = lat[int(len(lat) * 0.95)] if lat else 0.0
+    return st
+
+@app.errorhandler(RenderBusy)
+def _render_busy(_e):
+    resp = jsonify({"error": "Render queue is full, retry later"})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+@app.get("/api/render/stats")
+def api_render_stats():
+    return jsonify(render_stats())
+
+def cached_render(kind: str, style: str, payload, render=True):
+    """
+    Return (png_bytes, etag) of the 1200x630 master, drawing it only on a cache miss.
+    render=False only looks the master up: (None, key) on a miss.
+    """
+    style = _norm_style(style)
+    key = _render_key(kind, style, payload)
+    data = _cache_get(key)
+    if data is None and not render:
+        return None, key
+    metric_inc("cache_requests_total", cache="render", result="miss" if data is None else "hit")
+    if data is None:
+        metric_inc("renders_total", kind=kind, style=style)
+        data = _singleflight(key, _render_job, kind, style, payload)
+    return data, key
+
+# =========================
+# Output formats / sizes
+# =========================
+IMAGE_FORMATS = {
+    "png":  "image/png",
+    "png8": "image/png",     # quantized 256-colour palette
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+FORMAT_ALIASES = {"jpg": "jpeg", "optimized": "png8"}
+DEFAULT_QUALITY = {"jpeg": 85, "webp": 80}
+SIZE_PRESETS = {
+    "og":       (1200, 630),
+    "x":        (1200, 675),
+    "telegram": (640, 640),
+    "thumb":    (600, 315),
+    "thumb_sm": (300, 158),
+}
+
+def _resize_master(img: Image.Image, size) -> Image.Image:
+    """Scale the master into `size`; other aspect ratios get a blurred backdrop."""
+    if img.size == size:
+        return img
+    W, H = size
+    scale = min(W / img.width, H / img.height)
+    fit = (round(img.width * scale), round(img.height * scale))
+    if fit == size:
+        return img.resize(size, Image.LANCZOS)
+    out = img.resize(size, Image.BILINEAR).filter(ImageFilter.GaussianBlur(24))
+    out.paste(img.resize(fit, Image.LANCZOS), ((W - fit[0]) // 2, (H - fit[1]) // 2))
+    return out
+
+def _variant_job(master: bytes, fmt: str, size, quality):
+    """Derive an encoded variant from the cached master PNG, return (bytes, seconds)."""
+    t0 = time.perf_counter()
+    img = _resize_master(Image.open(BytesIO(master)).convert("RGB"), tuple(size))
+    buf = BytesIO()
+    with span("encode"):
+        if fmt == "png8":
+            img.quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, "PNG", optimize=True)
+        elif fmt == "webp":
+            img.save(buf, "WEBP", quality=quality, method=4)
+        elif fmt == "jpeg":
+            img.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+        else:
+            img.save(buf, "PNG")
+    return buf.getvalue(), time.perf_counter() - t0
+
+def negotiate_image(args, accept: str):
+    """
+    Resolve (format, size preset, quality, negotiated) from ?format=&size=&q=
+    and the Accept header. Raises ValueError on unknown values.
+    """
+    fmt = (args.get("format") or "").lower()
+    negotiated = not fmt
+    if negotiated:
+        fmt = "webp" if "image/webp" in (accept or "") else "png"
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    size = (args.get("size") or "og").lower()
+    if size not in SIZE_PRESETS:
+        raise ValueError(f"Unknown size: {size}")
+    quality = None
+    if fmt in DEFAULT_QUALITY:
+        try:
+            quality = int(args.get("q", DEFAULT_QUALITY[fmt]))
+        except ValueError:
+            raise ValueError("q must be an integer")
+        quality = max(1, min(95, quality))
+    return fmt, size, quality, negotiated
+
+def _variant_key(key: str, fmt: str, size: str, quality) -> str:
+    return hashlib.sha256(f"{key}:{fmt}:{size}:{quality}".encode()).hexdigest()
+
+def cached_image(kind: str, style: str, payload, fmt="png", size="og", quality=None, render=True):
+    """
+    Return (bytes, etag, mimetype); every variant derives from one cached master.
+    render=False never draws or encodes: bytes is None unless the variant is already cached.
+    """
+    master, key = cached_render(kind, style, payload, render)
+    if fmt == "png" and size == "og":
+        return master, key, IMAGE_FORMATS["png"]
+    vkey = _variant_key(key, fmt, size, quality)
+    data = _cache_get(vkey)
+    if data is None and (master is None or not render):
+        return None, vkey, IMAGE_FORMATS[fmt]
+    metric_inc("cache_requests_total", cache="variant", result="miss" if data is None else "hit")
+    if data is None:
+        metric_inc("variant_encodes_total", format=fmt, size=size)
+        data = _singleflight(vkey, _variant_job, master, fmt, SIZE_PRESETS[size], quality)
+    return data, vkey, IMAGE_FORMATS[fmt]
+
+def cached_image_response(data: bytes, etag: str, mimetype: str, vary_accept=False,
+                          cache_control=IMAGE_CACHE_CONTROL):
+    with span("send"):
+        resp = Response(data, mimetype=mimetype)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = cache_control
+        if vary_accept:
+            resp.vary.add("Accept")
+        resp = resp.make_conditional(request)
+    metric_inc("image_bytes_total", len(data) if resp.status_code == 200 else 0, format=mimetype)
+    return resp
+
+# =========================
+# Overload protection
+# =========================
+# Image renders get their own per-worker budget so they can't take every gunicorn
+# thread: at most RENDER_CONCURRENCY requests render, RENDER_WAITERS more wait up to
+# RENDER_WAIT seconds, everything beyond that is shed at once. The _singleflight
+# leader takes a render slot; requests for a render already in flight need no slot
+# but do hold a thread, so they share the RENDER_WAITERS budget and RENDER_WAIT.
+# Keep RENDER_CONCURRENCY + RENDER_WAITERS below --threads.
+RENDER_CONCURRENCY = int(os.environ.get("RENDER_CONCURRENCY", "2"))
+RENDER_WAITERS = int(os.environ.get("RENDER_WAITERS", "1"))
+RENDER_WAIT = float(os.environ.get("RENDER_WAIT", "1"))
+STALE_MAX = int(os.environ.get("STALE_MAX", "256"))  # last good image per (kind, symbol, style, variant)
+STALE_CACHE_CONTROL = "public, max-age=5, stale-while-revalidate=60"
+
+class RenderGate:
+    """Counting semaphore with a bounded wait queue."""
+
+    def __init__(self, limit: int, waiters: int):
+        self.limit = max(1, limit)
+        self.waiters = max(0, waiters)
+        self.waiting = 0
+        self._sem = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        if self._sem.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self.waiting >= self.waiters:
+                return False
+            self.waiting += 1
+        try:
+            return self._sem.acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def release(self):
+        self._sem.release()
+
+    def _shed(self):
+        with _INFLIGHT_LOCK:
+            _RENDER_STATS["shed"] += 1
+        metric_inc("render_admission_total", result="shed")
+        raise RenderBusy()
+
+    @contextmanager
+    def admit(self, timeout: float = RENDER_WAIT):
+        """Raise RenderBusy instead of queueing past the limit."""
+        if not self.acquire(timeout):
+            self._shed()
+        metric_inc("render_admission_total", result="admitted")
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def follow(self):
+        """A wait-queue place without a render slot (for coalesced requests)."""
+        with self._lock:
+            full = self.waiting >= self.waiters
+            if not full:
+                self.waiting += 1
+        if full:
+            self._shed()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+RENDER_GATE = RenderGate(RENDER_CONCURRENCY, RENDER_WAITERS)
+
+_STALE: "OrderedDict[tuple, tuple]" = OrderedDict()  # logical key -> (bytes, etag, mimetype)
+_STALE_LOCK = threading.Lock()
+_REFRESHING = set()
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refresh")
+
+def _stale_put(lkey: tuple, entry: tuple):
+    if STALE_MAX <= 0:
+        return
+    with _STALE_LOCK:
+        _STALE[lkey] = entry
+        _STALE.move_to_end(lkey)
+        while len(_STALE) > STALE_MAX:
+            _STALE.popitem(last=False)
+
+def _stale_get(lkey: tuple) -> Optional[tuple]:
+    with _STALE_LOCK:
+        return _STALE.get(lkey)
+
+def _refresh(lkey: tuple, args: tuple):
+    """Re-render lkey off the request thread; one refresh per key at a time."""
+    with _STALE_LOCK:
+        if lkey in _REFRESHING:
+            return
+        _REFRESHING.add(lkey)
+
+    def job():
+        try:
+            with RENDER_GATE.admit():
+                _stale_put(lkey, cached_image(*args))
+        except RenderBusy:
+            pass  # still overloaded; the next request for lkey tries again
+        finally:
+            with _STALE_LOCK:
+                _REFRESHING.discard(lkey)
+    _refresh_executor.submit(job)
+
+def _share_image(kind: str, payload, ident: str):
+    """
+    Cache hit -> serve. Miss with an older image for the same card -> serve that,
+    re-render in the background. Cold miss -> render (or join the render in flight).
+    """
+    try:
+        fmt, size, quality, negotiated = negotiate_image(request.args, request.headers.get("Accept"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    style = _norm_style(request.args.get("style", DEFAULT_STYLE))
+    args = (kind, style, payload, fmt, size, quality)
+    lkey = (kind, ident, style, fmt, size, quality)
+    entry = cached_image(*args, render=False)
+    if entry[0] is None:
+        stale = _stale_get(lkey)
+        if stale is not None:
+            with _INFLIGHT_LOCK:
+                _RENDER_STATS["stale"] += 1
+            metric_inc("stale_images_total", kind=kind)
+            _refresh(lkey, args)
+            return cached_image_response(*stale, vary_accept=negotiated, cache_control=STALE_CACHE_CONTROL)
+        entry = cached_image(*args)
+    _stale_put(lkey, entry)
+    return cached_image_response(*entry, vary_accept=negotiated)
 
 # =========================
 # Share: OG images
 # =========================
 @app.get("/share/image/top.png")
 def share_image_top():
-    style = request.args.get("style", DEFAULT_STYLE).lower()
-    if style == "classic":
-        buf = render_top_classic(PAIRS)
-    elif style == "violet":
-        buf = render_top_violet(PAIRS)
-    else:
-        buf = render_top_neo(PAIRS)
-    return nocache_png_response(buf)
+    return _share_image("top", MARKET.top(5), "top")
 
 @app.get("/share/image/pair/<symbol>.png")
 def share_image_pair(symbol):
-    d = DETAILS.get(symbol.upper())
+    d = pair_card(symbol)
     if not d:
         return jsonify({"error": "Not found"}), 404
-    style = request.args.get("style", DEFAULT_STYLE).lower()
-    if style == "classic":
-        buf = render_pair_classic(d)
-    elif style == "violet":
-        buf = render_pair_violet(d)
-    else:
-        buf = render_pair_neo(d)
-    return nocache_png_response(buf)
+    return _share_image("pair", d, d["symbol"])
 
 # =========================
 # Share: OG pages
@@ -395,42 +1885,80 @@ SHARE_PAGE_TPL = """
 </html>
 """
 
+PAGE_CACHE_CONTROL = "public, max-age=60, s-maxage=300"
+# link-preview bots only read the og:/twitter: tags and fetch og:image right after
+CRAWLER_UA = ("telegrambot", "twitterbot", "facebookexternalhit", "facebot", "slackbot",
+              "discordbot", "linkedinbot", "whatsapp", "skypeuripreview", "vkshare", "redditbot")
+
+@lru_cache(maxsize=None)
+def _share_page_template():
+    """SHARE_PAGE_TPL parsed and compiled once (same autoescaping as render_template_string)."""
+    return app.jinja_env.from_string(SHARE_PAGE_TPL)
+
+def _is_crawler() -> bool:
+    ua = (request.headers.get("User-Agent") or "").lower()
+    return any(bot in ua for bot in CRAWLER_UA)
+
+def _warm_image(kind: str, symbol: Optional[str] = None):
+    """
+    Render the og:image variant this bot will negotiate (bots send the same Accept
+    for the page and the image) in the background, so its follow-up fetch hits the
+    cache. Skipped when already cached; _refresh queues at most one job per card.
+    """
+    fmt, size, quality, _ = negotiate_image({}, request.headers.get("Accept"))
+    payload = MARKET.top(5) if kind == "top" else pair_card(symbol)
+    if payload is None:
+        return
+    args = (kind, _norm_style(DEFAULT_STYLE), payload, fmt, size, quality)
+    if cached_image(*args, render=False)[0] is None:
+        _refresh((kind, symbol or "top", args[1], fmt, size, quality), args)
+
+def _share_page(key: tuple, build):
+    """key = (kind, symbol, base, ...versions); build() renders the HTML bytes on a miss."""
+    if _is_crawler():
+        _warm_image(key[0], key[1])
+    entry = _body_entry(("page",) + key, build, raw=True)
+    return _serve_entry(entry, "text/html", PAGE_CACHE_CONTROL)
+
 @app.get("/share/top")
 def share_top_page():
     base = request.url_root.rstrip("/")
-    image = bust(base + url_for("share_image_top") + f"?style={DEFAULT_STYLE}")
-    app_url = base + "/"
-    html = render_template_string(
-        SHARE_PAGE_TPL,
-        title="Best Performing Overall — Crypto Prototype",
-        desc="Top 5 coins by trading score and APY.",
-        image=image,
-        app_url=app_url,
-    )
-    return html
+
+    def build():
+        image = bust(base + url_for("share_image_top") + f"?style={DEFAULT_STYLE}")
+        return _share_page_template().render(
+            title="Best Performing Overall — Crypto Prototype",
+            desc="Top 5 coins by trading score and APY.",
+            image=image,
+            app_url=base + "/",
+        ).encode("utf-8")
+
+    return _share_page(("top", None, base, share_version()), build)
 
 @app.get("/share/pair/<symbol>")
 def share_pair_page(symbol):
-    d = DETAILS.get(symbol.upper())
-    if not d:
+    sym = symbol.upper()
+    if sym not in MARKET:
         return "Not Found", 404
     base = request.url_root.rstrip("/")
-    image = bust(base + url_for("share_image_pair", symbol=symbol.upper()) + f"?style={DEFAULT_STYLE}")
-    app_url = base + f"/#/{symbol.upper()}"
-    html = render_template_string(
-        SHARE_PAGE_TPL,
-        title=f'{d["name"]} ({d["symbol"]}) — Trading Analysis',
-        desc=f'Price ${d["price"]:.2f} · Score {d["score"]}% · Volatility {d["volatility"]}%',
-        image=image,
-        app_url=app_url,
-    )
-    return html
+
+    def build():
+        d = MARKET.get(sym)
+        image = bust(base + url_for("share_image_pair", symbol=sym) + f"?style={DEFAULT_STYLE}")
+        return _share_page_template().render(
+            title=f'{d["name"]} ({d["symbol"]}) — Trading Analysis',
+            desc=f'Price ${d["price"]:.2f} · Score {d["score"]}% · Volatility {d["volatility"]}%',
+            image=image,
+            app_url=base + f"/#/{sym}",
+        ).encode("utf-8")
+
+    return _share_page(("pair", sym, base, share_version(), MARKET.symbol_version(sym)), build)
 
 # =========================
 # Share: API for frontend menus
 # =========================
-def _share_payload(kind: str, symbol: Optional[str] = None):
-    base = request.url_root.rstrip("/")
+def _share_payload(kind: str, symbol: Optional[str] = None, base: Optional[str] = None):
+    base = base or request.url_root.rstrip("/")
     style_q = f"?style={DEFAULT_STYLE}"
     if kind == "top":
         page  = bust(f"{base}/share/top")
@@ -440,21 +1968,312 @@ def _share_payload(kind: str, symbol: Optional[str] = None):
         assert symbol is not None
         page  = bust(f"{base}/share/pair/{symbol}")
         image = bust(f"{base}/share/image/pair/{symbol}.png{style_q}")
-        title = f'{DETAILS[symbol]["name"]} ({symbol}) — Trading Analysis'
+        title = f'{MARKET.get(symbol)["name"]} ({symbol}) — Trading Analysis'
     tg_url = f"https://t.me/share/url?url={page}&text={title}"
     x_url  = f"https://twitter.com/intent/tweet?text={title}&url={page}"
     return {"page_url": page, "image_url": image, "telegram_url": tg_url, "x_url": x_url, "title": title}
 
 @app.get("/api/share/top")
 def api_share_top():
-    return jsonify(_share_payload("top"))
+    base = request.url_root.rstrip("/")
+    return cached_json(("share", "top", base, share_version()),
+                       lambda: _share_payload("top", base=base))
 
 @app.get("/api/share/pair/<symbol>")
 def api_share_pair(symbol):
     sym = symbol.upper()
-    if sym not in DETAILS:
+    if sym not in MARKET:
         return jsonify({"error": "Not found"}), 404
-    return jsonify(_share_payload("pair", sym))
+    base = request.url_root.rstrip("/")
+    return cached_json(("share", sym, base, share_version(), MARKET.symbol_version(sym)),
+                       lambda: _share_payload("pair", sym, base=base))
+
+# =========================
+# Batch API (bootstrap / multi-symbol details)
+# =========================
+BOOTSTRAP_DETAILS_MAX = 20
+BATCH_SYMBOLS_MAX = 100
+
+def _detail_fragment(sym: str) -> bytes:
+    d, version = MARKET.get_versioned(sym)
+    return _json_fragment(("pair", sym, version), lambda: d)
+
+def _share_fragment(sym: Optional[str], base: str) -> bytes:
+    if sym is None:
+        return _json_fragment(("share", "top", base, share_version()),
+                              lambda: _share_payload("top", base=base))
+    return _json_fragment(("share", sym, base, share_version(), MARKET.symbol_version(sym)),
+                          lambda: _share_payload("pair", sym, base=base))
+
+def _json_object(parts) -> bytes:
+    """Splice {key: fragment} pairs into one JSON object without re-serializing."""
+    return b"{" + b",".join(json.dumps(k).encode("utf-8") + b":" + v for k, v in parts) + b"}"
+
+def _batch_parts(symbols, base: str, share: bool) -> list:
+    parts = [("details", _json_object((sym, _detail_fragment(sym)) for sym in symbols))]
+    if share:
+        parts.append(("share", _json_object((sym, _share_fragment(sym, base)) for sym in symbols)))
+    return parts
+
+@app.get("/api/bootstrap")
+def api_bootstrap():
+    """Pairs, top share payload and details/share for the first N symbols in one call."""
+    try:
+        n = max(0, min(BOOTSTRAP_DETAILS_MAX, int(request.args.get("details", 1))))
+        limit = max(1, min(PAGE_LIMIT_MAX, int(request.args.get("limit", PAGE_LIMIT_DEFAULT))))
+    except ValueError:
+        return jsonify({"error": "Bad details or limit"}), 400
+    base = request.url_root.rstrip("/")
+    items, nxt, version = MARKET.page_versioned(limit)
+    symbols = [it["symbol"] for it in items[:n]]
+
+    def build():
+        pairs = _json_fragment(("pairs", version, limit, None),
+                               lambda: {"items": items, "next_cursor": nxt})
+        return _json_object([
+            ("pairs", pairs),
+            ("share_top", _share_fragment(None, base)),
+        ] + _batch_parts(symbols, base, share=True)) + b"\n"
+
+    return cached_json(("bootstrap", version, limit, n, base, share_version()), build, raw=True)
+
+@app.get("/api/pairs/details")
+def api_pairs_details():
+    """Details (and with share=1, share payloads) for ?symbols=BTC,ETH,..."""
+    symbols = []
+    for s in request.args.get("symbols", "").split(","):
+        s = s.strip().upper()
+        if s and s not in symbols:
+            symbols.append(s)
+    if len(symbols) > BATCH_SYMBOLS_MAX:
+        return jsonify({"error": f"At most {BATCH_SYMBOLS_MAX} symbols"}), 400
+    found = [s for s in symbols if s in MARKET]
+    missing = [s for s in symbols if s not in MARKET]
+    share = request.args.get("share") in ("1", "true")
+    base = request.url_root.rstrip("/")
+    key = ("details", tuple((s, MARKET.symbol_version(s)) for s in found), tuple(missing), share,
+           base if share else None, share_version())
+
+    def build():
+        parts = _batch_parts(found, base, share)
+        return _json_object(parts + [("missing", json.dumps(missing).encode("utf-8"))]) + b"\n"
+
+    return cached_json(key, build, raw=True)
+
+# =========================
+# Live stream (SSE)
+# =========================
+# Every store update is serialized once into a ring of SSE frames; each client
+# just slices the ring from its Last-Event-ID, so fan-out costs one join per
+# response and a slow client can never hold up the publisher or other clients.
+# A client that fell off the ring gets a "reset" event and re-bootstraps.
+# Under gthread workers a held response occupies a thread, so by default a
+# response only drains what is pending (SSE_HOLD=0) and EventSource reconnects
+# after SSE_RETRY_MS over the idle keep-alive socket. With an async worker
+# class set SSE_HOLD to keep connections open.
+# Event ids are "<epoch>.<seq>", seq being MARKET.version. The preloaded seed is
+# epoch "0"; a MARKET_FEED replay gets an epoch derived from the feed file, the same
+# in every worker, so a reconnect to another worker resumes where it left off (or
+# waits while that worker is behind). A foreign epoch, or an id too far ahead to be
+# the same replay, is answered with "reset" and the client resyncs in place.
+SSE_RING = int(os.environ.get("SSE_RING", "4096"))
+SSE_HOLD = float(os.environ.get("SSE_HOLD", "0"))
+SSE_RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "2000"))
+SSE_HEARTBEAT = 15.0
+
+class StreamHub:
+    def __init__(self, size: int):
+        self._ring = deque(maxlen=size)  # (seq, frame bytes)
+        self._cond = threading.Condition()
+        self.seq = 0
+        self.epoch = "0"
+
+    def rebase(self, epoch: str):
+        """Start a new id space: frames of the old one can't be replayed under it."""
+        with self._cond:
+            self.epoch = epoch
+            self._ring.clear()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}.{seq}"
+
+    def parse_id(self, raw: Optional[str]):
+        """Last-Event-ID -> (seq, reset): a foreign epoch or a seq a whole ring ahead resets."""
+        if not raw:
+            return self.seq, False
+        epoch, _, seq = raw.rpartition(".")
+        try:
+            seq = int(seq)
+        except ValueError:
+            return self.seq, False
+        if epoch != self.epoch or seq > self.seq + self._ring.maxlen:
+            return self.seq, True
+        return seq, False
+
+    def publish(self, seq: int, symbol: str, fields: dict):
+        data = dict(fields, symbol=symbol, version=seq)
+        frame = f"id: {self.event_id(seq)}\nevent: delta\ndata: {json.dumps(data, default=str)}\n\n".encode("utf-8")
+        with self._cond:
+            self._ring.append((seq, frame))
+            self.seq = seq
+            self._cond.notify_all()
+
+    def since(self, last: int):
+        """(frames after `last`, new last id, reset) without blocking."""
+        with self._cond:
+            if last >= self.seq:
+                return b"", last, False
+            if not self._ring or self._ring[0][0] > last + 1:
+                return b"", self.seq, True
+            # sequence numbers in the ring are contiguous
+            start = last + 1 - self._ring[0][0]
+            frames = [f for _, f in islice(self._ring, start, None)]
+            return b"".join(frames), self.seq, False
+
+    def wait(self, last: int, timeout: float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.seq > last, timeout)
+
+HUB = StreamHub(SSE_RING)
+HUB.seq = MARKET.version
+MARKET.add_listener(HUB.publish)
+
+def _sse_events(last: int, hold: float, reset=False):
+    yield f"retry: {SSE_RETRY_MS}\nid: {HUB.event_id(last)}\n\n".encode("utf-8")
+    deadline = time.monotonic() + hold
+    while True:
+        if not reset:
+            frames, last, reset = HUB.since(last)
+        if reset:
+            reset = False
+            yield f"id: {HUB.event_id(last)}\nevent: reset\ndata: {{}}\n\n".encode("utf-8")
+        elif frames:
+            yield frames
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not HUB.wait(last, min(remaining, SSE_HEARTBEAT)):
+            yield b": ping\n\n"
+
+@app.get("/api/stream")
+def api_stream():
+    """Per-symbol delta updates as Server-Sent Events."""
+    last, reset = HUB.parse_id(request.headers.get("Last-Event-ID") or request.args.get("last_id"))
+    resp = Response(stream_with_context(_sse_events(last, SSE_HOLD, reset)), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# =========================
+# Pre-render / static export
+# =========================
+EXPORT_EXT = {"png": "png", "png8": "opt.png", "webp": "webp", "jpeg": "jpg"}
+
+def _prerender_targets(styles):
+    """(kind, name, style, payload) for the top list and every symbol in the store."""
+    for style in styles:
+        yield "top", "top", style, MARKET.top(5)
+        for sym in MARKET.symbols():
+            yield "pair", f"pair/{sym}", style, pair_card(sym)
+
+def _export_name(style: str, name: str, fmt: str, size: str) -> str:
+    base = name if size == "og" else f"{name}@{size}"
+    return f"{style}/{base}.{EXPORT_EXT[fmt]}"
+
+def _export_job(kind: str, style: str, payload, outputs):
+    """Render one master and write its variants; outputs = [(path, fmt, size, quality)]."""
+    master, _ = _render_job(kind, style, payload)
+    for path, fmt, size, quality in outputs:
+        data = master
+        if not (fmt == "png" and size == "og"):
+            data, _ = _variant_job(master, fmt, SIZE_PRESETS[size], quality)
+        _write_atomic(path, data)
+    return len(outputs)
+
+def warm_render_cache(styles=("classic", "neo", "violet"), formats=("png",), sizes=("og",)):
+    """Fill the in-process cache inline (no pool), e.g. in the gunicorn master before fork."""
+    n = 0
+    for kind, _name, style, payload in _prerender_targets(styles):
+        # straight to _render_job, never _singleflight: its _pool() must not exist before fork
+        style = _norm_style(style)
+        key = _render_key(kind, style, payload)
+        master = _cache_get(key)
+        if master is None:
+            master = _render_job(kind, style, payload)[0]
+            _cache_put(key, master)
+        for fmt in formats:
+            for size in sizes:
+                if fmt == "png" and size == "og":
+                    continue
+                q = DEFAULT_QUALITY.get(fmt)
+                vkey = _variant_key(key, fmt, size, q)
+                if _cache_get(vkey) is None:
+                    _cache_put(vkey, _variant_job(master, fmt, SIZE_PRESETS[size], q)[0])
+                n += 1
+        n += 1
+    return n
+
+@app.cli.command("prerender")
+@click.option("--out", "out_dir", default="prerendered", show_default=True, help="Output directory.")
+@click.option("--style", "styles", multiple=True, help="Styles to render (default: all).")
+@click.option("--format", "formats", multiple=True, help="Formats to write (default: all).")
+@click.option("--size", "sizes", multiple=True, help="Size presets to write (default: og).")
+@click.option("--jobs", type=int, default=0, help="Worker processes (default: CPU count).")
+@click.option("--force", is_flag=True, help="Rewrite outputs that are already up to date.")
+def prerender_command(out_dir, styles, formats, sizes, jobs, force):
+    """Render every share image into OUT for nginx/CDN static serving."""
+    styles = styles or ("classic", "neo", "violet")
+    formats = [FORMAT_ALIASES.get(f, f) for f in (formats or IMAGE_FORMATS)]
+    sizes = sizes or ("og",)
+    for f in formats:
+        if f not in IMAGE_FORMATS:
+            raise click.BadParameter(f"unknown format {f}", param_hint="--format")
+    for z in sizes:
+        if z not in SIZE_PRESETS:
+            raise click.BadParameter(f"unknown size {z}", param_hint="--size")
+
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    try:
+        with open(manifest_path) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        manifest = {}
+
+    jobs_args, skipped = [], 0
+    for kind, name, style, payload in _prerender_targets(styles):
+        key = _render_key(kind, style, payload)
+        outputs = []
+        for fmt in formats:
+            for size in sizes:
+                q = DEFAULT_QUALITY.get(fmt)
+                etag = key if (fmt == "png" and size == "og") else _variant_key(key, fmt, size, q)
+                rel = _export_name(style, name, fmt, size)
+                path = os.path.join(out_dir, rel)
+                if not force and manifest.get(rel) == etag and os.path.exists(path):
+                    skipped += 1
+                    continue
+                manifest[rel] = etag
+                outputs.append((path, fmt, size, q))
+        if outputs:
+            jobs_args.append((kind, style, payload, outputs))
+
+    jobs = jobs or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    written = 0
+    if jobs > 1 and len(jobs_args) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            for n in ex.map(_export_job, *zip(*jobs_args)):
+                written += n
+    else:
+        for args in jobs_args:
+            written += _export_job(*args)
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    click.echo(f"prerender: {written} written, {skipped} up to date, "
+               f"{time.perf_counter() - t0:.1f}s -> {out_dir}")
+
+if os.environ.get("PRERENDER_ON_START"):
+    # with `gunicorn --preload` this runs once in the master; workers share the bytes copy-on-write
+    warm_render_cache(formats=tuple(os.environ.get("PRERENDER_FORMATS", "png").split(",")))
 
 # =========================
 # Dev server
@@ -0,0 +1,65 @@
+"""Shared helpers for the benchmark scripts: result files and regression checks."""
+import json
+import os
+import platform
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# metric name suffix -> direction; anything else is informational only
+LOWER_IS_BETTER = ("_ms", "_bytes", "_kib")
+HIGHER_IS_BETTER = ("rps",)
+NOT_GATED = ("_max_ms",)  # single-sample extremes: reported, too noisy to fail on
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def save(path, kind, results, **meta):
+    doc = {
+        "kind": kind,
+        "meta": dict(meta, python=platform.python_version(), machine=platform.machine(),
+                     cpus=os.cpu_count(), time=time.strftime("%Y-%m-%dT%H:%M:%S")),
+        "results": results,
+    }
+    with open(path, "w") as fh:
+        json.dump(doc, fh, indent=2, sort_keys=True)
+    return doc
+
+
+def compare(current, baseline_path, tolerance):
+    """
+    Print metrics that regressed by more than `tolerance` (fraction) against
+    the baseline file; return the number of regressions.
+    """
+    with open(baseline_path) as fh:
+        base = json.load(fh)["results"]
+    bad = 0
+    for name, metrics in sorted(current.items()):
+        for metric, value in sorted(metrics.items()):
+            ref = base.get(name, {}).get(metric)
+            if not isinstance(ref, (int, float)) or not ref or value is None:
+                continue
+            if metric.endswith(NOT_GATED):
+                continue
+            if metric.endswith(LOWER_IS_BETTER):
+                worse = value > ref * (1 + tolerance)
+            elif metric.endswith(HIGHER_IS_BETTER):
+                worse = value < ref * (1 - tolerance)
+            else:
+                continue
+            if worse:
+                bad += 1
+                print(f"REGRESSION {name} {metric}: {value:.3f} vs baseline {ref:.3f}")
+    print(f"{bad} regression(s) beyond {tolerance:.0%}")
+    return bad
@@ -0,0 +1,152 @@
+"""
+End-to-end load test: starts the app under gunicorn with the Procfile's web
+command on a loopback port, then drives each endpoint with keep-alive client
+threads and reports latency percentiles and requests/second.
+
+    python bench/load.py --duration 10 --concurrency 16 --out bench-load.json
+    python bench/load.py --cold              # no render cache, no stale images: every image is drawn
+    python bench/load.py --baseline bench-load.json --tolerance 0.3
+"""
+import argparse
+import http.client
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from common import ROOT, compare, percentile, save
+
+ENDPOINTS = {
+    "api.pairs": "/api/pairs",
+    "api.bootstrap": "/api/bootstrap",
+    "page.pair": "/share/pair/BTC",
+    "image.top": "/share/image/top.png",
+    "image.pair.neo": "/share/image/pair/BTC.png?style=neo",
+    "image.pair.violet.webp": "/share/image/pair/ETH.png?style=violet&format=webp",
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _procfile_cmd(port):
+    with open(os.path.join(ROOT, "Procfile")) as fh:
+        for line in fh:
+            if line.startswith("web:"):
+                cmd = line.split(":", 1)[1].strip()
+                break
+        else:
+            raise SystemExit("no web: entry in Procfile")
+    cmd = cmd.replace("$PORT", str(port)).replace("0.0.0.0", "127.0.0.1")
+    argv = shlex.split(cmd)
+    argv[0:1] = [sys.executable, "-m", "gunicorn"]
+    return argv
+
+
+def _wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/pairs")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("gunicorn did not come up")
+
+
+def drive(port, path, duration, concurrency):
+    lat, errors, shed, nbytes = [], [0], [0], [0]
+    lock = threading.Lock()
+    stop = time.monotonic() + duration
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine = []
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            try:
+                conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+                resp = conn.getresponse()
+                body = resp.read()
+                ok, status = resp.status < 400, resp.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                ok, status, body = False, None, b""
+            mine.append((time.perf_counter() - t0) * 1000)
+            with lock:
+                nbytes[0] += len(body)
+                if not ok:
+                    errors[0] += 1
+                if status == 503:  # RenderBusy: shed by the render gate
+                    shed[0] += 1
+        with lock:
+            lat.extend(mine)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    return {
+        "requests": len(lat),
+        "errors": errors[0],
+        "shed": shed[0],
+        "rps": (len(lat) - errors[0]) / elapsed,  # successful responses only
+        "p50_ms": percentile(lat, 50),
+        "p90_ms": percentile(lat, 90),
+        "p99_ms": percentile(lat, 99),
+        "max_ms": max(lat) if lat else 0.0,
+        "avg_response_bytes": nbytes[0] / max(1, len(lat)),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--duration", type=float, default=5.0, help="seconds per endpoint")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS))
+    ap.add_argument("--cold", action="store_true",
+                    help="disable the render cache and stale-image serving in the server")
+    ap.add_argument("--out")
+    ap.add_argument("--baseline")
+    ap.add_argument("--tolerance", type=float, default=0.3)
+    args = ap.parse_args(argv)
+
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port))
+    if args.cold:
+        env["RENDER_CACHE_MAX"] = "0"
+        env["STALE_MAX"] = "0"
+    proc = subprocess.Popen(_procfile_cmd(port), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    try:
+        _wait_ready(port)
+        for name in args.endpoint or ENDPOINTS:
+            r = results[name] = drive(port, ENDPOINTS[name], args.duration, args.concurrency)
+            print(f"{name:24s} {r['rps']:8.1f} req/s  p50 {r['p50_ms']:7.2f}  p90 {r['p90_ms']:7.2f}  "
+                  f"p99 {r['p99_ms']:7.2f} ms  errors {r['errors']} (shed {r['shed']})")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    if args.out:
+        save(args.out, "load", results, duration=args.duration,
+             concurrency=args.concurrency, cold=args.cold)
+    if args.baseline:
+        return 1 if compare(results, args.baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
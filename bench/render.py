@@ -0,0 +1,121 @@
+"""
+Renderer microbenchmarks: wall time of the draw and encode phases, peak resident
+memory of one render (Linux: VmHWM, so Pillow's C buffers count) and output bytes
+for every (kind, style).
+
+    python bench/render.py --runs 20 --out bench-render.json
+    python bench/render.py --baseline bench-render.json --tolerance 0.25   # exit 1 on regression
+"""
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import statistics
+import sys
+import time
+
+from common import compare, save
+
+import app as A
+
+STYLES = ("classic", "neo", "violet")
+
+try:
+    _LIBC = ctypes.CDLL(ctypes.util.find_library("c"))
+except OSError:
+    _LIBC = None
+
+
+def _status_kib(field):
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith(field):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+def peak_rss_kib(fn):
+    """
+    Resident memory growth at the peak of fn(): resets the kernel's high-water mark
+    (clear_refs 5) and reads VmHWM afterwards. None where /proc doesn't support it.
+    """
+    gc.collect()
+    if _LIBC is not None and hasattr(_LIBC, "malloc_trim"):
+        _LIBC.malloc_trim(0)  # freed heap would otherwise absorb the render
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        base = _status_kib("VmRSS:")
+        fn()
+        return _status_kib("VmHWM:") - base
+    except OSError:
+        fn()
+        return None
+
+
+def _payloads():
+    top = A.MARKET.top(5)
+    price = A.MARKET.get("BTC")["price"]
+    for i in range(A.HISTORY_SIZE):  # full ring: the sparkline costs what it costs in production
+        A.HISTORY.record(0, "BTC", {"price": price * (1 + 0.01 * ((i * 7919) % 200 - 100) / 100)})
+    pair = A.pair_card("BTC")
+    return {"top": top, "pair": pair}
+
+
+def bench_case(kind, style, payload, runs, mode):
+    """mode: 'full' (no frame reuse) or 'incremental' (price tick between renders)."""
+    A.INCREMENTAL_FRAMES = 32 if mode == "incremental" else 0
+    A.render_plan(kind, style, payload)  # warm fonts, plan and template
+    draw, encode, sizes = [], [], []
+    for i in range(runs):
+        if mode == "incremental":
+            payload = dict(payload, price=round(payload["price"] * 1.001, 2))
+        gc.collect()
+        t0 = time.perf_counter()
+        img = A.render_plan(kind, style, payload)
+        t1 = time.perf_counter()
+        buf = A._encode_png(img)
+        t2 = time.perf_counter()
+        draw.append((t1 - t0) * 1000)
+        encode.append((t2 - t1) * 1000)
+        sizes.append(buf.getbuffer().nbytes)
+
+    peak = peak_rss_kib(lambda: A._encode_png(A.render_plan(kind, style, payload)))
+    return {
+        "draw_ms": statistics.median(draw),
+        "encode_ms": statistics.median(encode),
+        "total_ms": statistics.median(d + e for d, e in zip(draw, encode)),
+        "draw_max_ms": max(draw),
+        "peak_rss_kib": peak,
+        "output_bytes": statistics.median(sizes),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--style", action="append", choices=STYLES)
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="compare against this results JSON")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    payloads = _payloads()
+    results = {}
+    for style in args.style or STYLES:
+        for kind in ("top", "pair"):
+            modes = ("full", "incremental") if kind == "pair" else ("full",)
+            for mode in modes:
+                name = f"{kind}.{style}.{mode}"
+                r = results[name] = bench_case(kind, style, payloads[kind], args.runs, mode)
+                print(f"{name:28s} draw {r['draw_ms']:7.2f} ms  encode {r['encode_ms']:7.2f} ms  "
+                      f"peak {r['peak_rss_kib'] or 0:8.0f} KiB  out {r['output_bytes'] / 1024:7.1f} KiB")
+    if args.out:
+        save(args.out, "render", results, runs=args.runs)
+    if args.baseline:
+        return 1 if compare(results, args.baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -33,17 +33,36 @@ function makeCoinIcon(symbol, big=false){
 }
 
 /* ==== API ==== */
-async function fetchPairs() {
-  const res = await fetch("/api/pairs");
+// details / share payloads already delivered by /api/bootstrap or a batch call
+const detailsCache = new Map();
+const shareCache = new Map();
+
+function remember(batch) {
+  Object.entries(batch.details || {}).forEach(([s, d]) => detailsCache.set(s, d));
+  Object.entries(batch.share || {}).forEach(([s, p]) => shareCache.set(s, p));
+}
+async function fetchBootstrap() {
+  const res = await fetch("/api/bootstrap?details=1");
   const data = await res.json();
-  return data.items || [];
+  remember(data);
+  shareCache.set("top", data.share_top);
+  return (data.pairs && data.pairs.items) || [];
+}
+async function prefetchDetails(symbols) {
+  const todo = symbols.filter(s => !detailsCache.has(s));
+  if (!todo.length) return;
+  const res = await fetch(`/api/pairs/details?share=1&symbols=${todo.join(",")}`);
+  if (res.ok) remember(await res.json());
 }
 async function fetchDetails(symbol) {
+  if (detailsCache.has(symbol)) return detailsCache.get(symbol);
   const res = await fetch(`/api/pair/${symbol}`);
   if (!res.ok) throw new Error("Not found");
   return res.json();
 }
 async function shareData(kind, symbol=null) {
+  const cached = shareCache.get(kind === "top" ? "top" : symbol);
+  if (cached) return cached;
   const url = kind === "top" ? "/api/share/top" : `/api/share/pair/${symbol}`;
   const res = await fetch(url);
   return res.json();
@@ -109,8 +128,16 @@ function formatMoney(n) {
 }
 
 /* ==== Details ==== */
+let currentSymbol = null;
+
 async function openDetails(symbol) {
   const d = await fetchDetails(symbol);
+  currentSymbol = symbol;
+  await renderDetails(d);
+  detailsRoot.scrollIntoView({ behavior: "smooth", block: "start" });
+}
+
+async function renderDetails(d) {
   detailsRoot.classList.remove("hidden");
 
   // header with its own share button + menu
@@ -141,26 +168,95 @@ async function openDetails(symbol) {
   headerIcon.innerHTML = ""; // clear placeholder
   headerIcon.appendChild(makeCoinIcon(d.symbol, true));
 
-  const payload = await shareData("pair", symbol);
+  const payload = await shareData("pair", d.symbol);
   const menuCoin = document.getElementById("menu-coin");
   renderShareMenu(menuCoin, payload);
   document.getElementById("share-coin-btn").onclick = (e) => {
     e.stopPropagation();
     menuCoin.classList.toggle("hidden");
   };
+}
 
-  detailsRoot.scrollIntoView({ behavior: "smooth", block: "start" });
+/* ==== Live updates (SSE) ==== */
+let currentItems = [];
+let stream = null;
+let pending = false;
+
+function applyDelta(delta) {
+  const { symbol } = delta;
+  delete delta.version;
+  const d = detailsCache.get(symbol);
+  if (d) detailsCache.set(symbol, { ...d, ...delta });
+  const item = currentItems.find(it => it.symbol === symbol);
+  if (item) {
+    ["name", "score", "apy"].forEach(k => { if (k in delta) item[k] = delta[k]; });
+  }
+  // coalesce bursts of deltas into one repaint per frame
+  if (!pending) {
+    pending = true;
+    requestAnimationFrame(() => {
+      pending = false;
+      currentItems.sort((a, b) => b.score - a.score || b.apy - a.apy || (a.symbol < b.symbol ? -1 : 1));
+      currentItems.forEach((it, i) => (it.rank = i + 1));
+      renderPairs(currentItems);
+      if (currentSymbol && detailsCache.has(currentSymbol)) renderDetails(detailsCache.get(currentSymbol));
+    });
+  }
+}
+
+// the stream lost its place (fell off the ring, other feed): refetch in place,
+// keeping the open coin and the scroll position
+let resyncing = false;
+async function resync() {
+  if (resyncing) return;
+  resyncing = true;
+  try {
+    detailsCache.clear();
+    shareCache.clear();
+    const items = await fetchBootstrap();
+    await prefetchDetails(items.map(it => it.symbol));
+    currentItems = items;
+    renderPairs(items);
+    if (currentSymbol) await renderDetails(await fetchDetails(currentSymbol));
+  } finally {
+    resyncing = false;
+  }
+}
+
+function connectStream() {
+  if (stream || !window.EventSource) return;
+  stream = new EventSource("/api/stream");
+  stream.addEventListener("delta", (e) => applyDelta(JSON.parse(e.data)));
+  stream.addEventListener("reset", () => resync());
 }
 
+// hidden tabs don't keep reconnecting; catch up in place when shown again
+document.addEventListener("visibilitychange", () => {
+  if (document.hidden) {
+    if (stream) stream.close();
+    stream = null;
+  } else if (!stream && currentItems.length) {
+    resync().then(connectStream);
+  }
+});
+
 /* ==== Boot ==== */
 async function boot() {
-  const items = await fetchPairs();
+  detailsCache.clear();
+  shareCache.clear();
+  // one round trip: list + top share payload + first coin's details/share
+  const items = await fetchBootstrap();
+  currentItems = items;
   renderPairs(items);
   if (items[0]) openDetails(items[0].symbol);
 
   // top share menu
   const payload = await shareData("top");
   renderShareMenu(menuTop, payload);
+
+  // warm the rest of the visible list in a single batch call
+  prefetchDetails(items.map(it => it.symbol));
+  connectStream();
 }
 
 refreshBtn.addEventListener("click", boot);
@@ -0,0 +1,32 @@
+"""Incremental (dirty-region) pair renders must stay byte-identical to full renders."""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as A  # noqa: E402
+
+
+@pytest.mark.parametrize("style", ["classic", "neo", "violet"])
+def test_incremental_matches_full_render(style, monkeypatch):
+    rng = random.Random(style)
+    d = dict(A.MARKET.get("BTC"), spark=[])
+    for tick in range(120):
+        d = dict(
+            d,
+            price=round(d["price"] * (1 + rng.gauss(0, 0.02)), 2),
+            change_pct=round(rng.uniform(-15, 15), 2),
+            score=rng.randint(1, 100),
+            in_channel=rng.random() < 0.5,
+            spark=d["spark"][-47:] + [d["price"]],
+        )
+        if tick % 40 == 39:
+            d["name"] = rng.choice(["Bitcoin", "Wrapped Bitcoin", "BTC"])
+        monkeypatch.setattr(A, "INCREMENTAL_FRAMES", 4)
+        incremental = A.render_plan("pair", style, d)
+        monkeypatch.setattr(A, "INCREMENTAL_FRAMES", 0)
+        full = A.render_plan("pair", style, d)
+        assert incremental.tobytes() == full.tobytes(), f"tick {tick} diverged"